@@ -0,0 +1,48 @@
+##Micro-benchmark: building bulk-send messages with a pre-encoded resume vs add_attachment per message
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+from email.message import EmailMessage
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mailer import get_attachment
+
+
+def build(i, pdf, pre_encoded):
+    msg = EmailMessage()
+    msg['Subject'] = f"Application {i}"
+    msg['From'] = "me@example.com"
+    msg['To'] = f"recruiter{i}@example.com"
+    msg.set_content("Dear Hiring Manager,\n\nPlease find my resume attached.\n")
+    if pre_encoded:
+        get_attachment(pdf, "resume.pdf").attach_to(msg)
+    else:
+        msg.add_attachment(pdf, maintype='application', subtype='pdf', filename="resume.pdf")
+    return msg
+
+
+def run(pdf, count, pre_encoded):
+    tracemalloc.start()
+    started = time.perf_counter()
+    messages = [build(i, pdf, pre_encoded) for i in range(count)]
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del messages
+    return elapsed, peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark attachment encoding for bulk sends.")
+    parser.add_argument("--messages", type=int, default=200, help="Messages to build")
+    parser.add_argument("--size", type=int, default=300_000, help="Resume PDF size in bytes")
+    args = parser.parse_args()
+
+    pdf = os.urandom(args.size)
+    for label, pre_encoded in (("add_attachment", False), ("pre-encoded", True)):
+        elapsed, peak = run(pdf, args.messages, pre_encoded)
+        print(f"{label:15s} {args.messages} messages in {elapsed:.2f}s "
+              f"({elapsed / args.messages * 1000:.2f} ms each), peak {peak / 1e6:.1f} MB")
@@ -0,0 +1,93 @@
+##Micro-benchmark: utils.clean_text vs the original four-pass regex cleaner
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import clean_text, clean_text_stream
+
+
+def legacy_clean_text(text):
+    # The original implementation, kept here as the baseline
+    text = re.sub(r'<[^>]*?>', '', text)
+    text = re.sub(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\,)]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', '', text)
+    text = re.sub(r'[^a-zA-Z0-9\s]', ' ', text)
+    text = re.sub(r'\s{2,}', ' ', text)
+    text = text.strip()
+    return text
+
+
+WORDS = ("python", "engineer", "streamlit", "experience", "team", "LLM", "deploy", "testing", "cloud", "remote")
+
+
+def make_page(size, html=True, seed=0):
+    """Builds a synthetic career page of roughly `size` characters."""
+    rng = random.Random(seed)
+    parts, total = [], 0
+    while total < size:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(12)) + ". "
+        if html:
+            r = rng.random()
+            if r < 0.1:
+                sentence = "<script>var cfg = {a: 1, b: '<b>'};</script>" + sentence
+            elif r < 0.2:
+                sentence = "<nav><a href='/jobs'>Jobs</a> | <a href='/about'>About</a></nav>" + sentence
+            elif r < 0.5:
+                sentence = f"<p class='jd'>{sentence}</p>\n"
+        if rng.random() < 0.2:
+            sentence += "Apply at https://careers.example.com/jobs?id=1234&ref=board  \n"
+        parts.append(sentence)
+        total += len(sentence)
+    return "".join(parts)
+
+
+def bench(fn, text, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    fn(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def bench_stream(text, chunk_size):
+    # Feeds the page in chunks and discards output as it goes, like cleaning a file on disk
+    tracemalloc.start()
+    started = time.perf_counter()
+    for _ in clean_text_stream(text[i:i + chunk_size] for i in range(0, len(text), chunk_size)):
+        pass
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare utils.clean_text with the original cleaner.")
+    parser.add_argument("--sizes", default="100000,1000000,5000000", help="Comma-separated input sizes in characters")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--chunk-size", type=int, default=64 * 1024)
+    args = parser.parse_args()
+
+    print(f"{'input':>18} {'legacy s':>9} {'new s':>9} {'speedup':>8} {'legacy peak MB':>15} {'new peak MB':>12} {'stream peak MB':>15}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        for html in (False, True):
+            text = make_page(size, html=html)
+            if not html:
+                # Plain text must come out exactly as before
+                assert clean_text(text) == legacy_clean_text(text), "output differs from the legacy cleaner"
+            legacy_time, legacy_peak = bench(legacy_clean_text, text, args.repeat)
+            new_time, new_peak = bench(clean_text, text, args.repeat)
+            _, stream_peak = bench_stream(text, args.chunk_size)
+            label = f"{size // 1000}k {'html' if html else 'plain'}"
+            print(f"{label:>18} {legacy_time:9.3f} {new_time:9.3f} {legacy_time / new_time:7.2f}x "
+                  f"{legacy_peak / 1e6:15.1f} {new_peak / 1e6:12.1f} {stream_peak / 1e6:15.1f}")
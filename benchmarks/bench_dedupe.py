@@ -0,0 +1,61 @@
+##Micro-benchmark: MinHash signing and LSH lookups for near-duplicate job postings
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dedupe import NearDuplicateIndex
+from bench_clean_text import make_page
+
+
+def mutate(text, rng, rate=0.01):
+    """Reposts a JD with a few words swapped or dropped, like the same ad on another board."""
+    words = text.split()
+    out = []
+    for word in words:
+        r = rng.random()
+        if r < rate / 2:
+            continue
+        out.append("remote" if r < rate else word)
+    return " ".join(out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark near-duplicate detection.")
+    parser.add_argument("--postings", type=int, default=20000, help="Distinct postings to index")
+    parser.add_argument("--queries", type=int, default=2000, help="Near-duplicate reposts to look up")
+    parser.add_argument("--size", type=int, default=3000, help="Characters per posting")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    postings = [make_page(args.size, html=False, seed=i) for i in range(args.postings)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = NearDuplicateIndex(os.path.join(tmp, "dedupe.sqlite3"), threshold=0.85)
+
+        started = time.perf_counter()
+        index.signatures(postings)
+        signing = time.perf_counter() - started
+        print(f"signatures: {args.postings} postings in {signing:.2f}s ({args.postings / signing:.0f}/s)")
+
+        started = time.perf_counter()
+        index.add_many(postings)
+        print(f"add_many:   {args.postings} postings in {time.perf_counter() - started:.2f}s")
+
+        picks = [rng.randrange(args.postings) for _ in range(args.queries)]
+        hits = 0
+        started = time.perf_counter()
+        for i in picks:
+            match = index.query(mutate(postings[i], rng))
+            hits += bool(match and match["text"] == postings[i])
+        elapsed = time.perf_counter() - started
+        print(f"query:      {args.queries} reposts in {elapsed:.2f}s ({elapsed / args.queries * 1000:.2f} ms each), "
+              f"{hits / args.queries:.1%} matched their original")
+
+        fresh = [make_page(args.size, html=False, seed=args.postings + i) for i in range(args.queries)]
+        false_hits = sum(1 for text in fresh if index.query(text))
+        print(f"unrelated:  {false_hits}/{args.queries} falsely matched")
@@ -0,0 +1,70 @@
+##Tail latency with and without hedging, against two local mock endpoints
+#
+# The primary mock answers most requests quickly but stalls on a share of them (--tail-rate);
+# the secondary is a steady, slightly slower model. The same workload runs once with only the
+# primary in the pool and once with both, so the p95/p99 difference is the effect of hedging.
+import io
+import os
+import sys
+import json
+import argparse
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mock_groq import MockGroqServer
+from run_benchmarks import run_scenario
+from bench_clean_text import make_page
+
+
+def run(pool_spec, args):
+    import hedging
+    import email_generator
+
+    # A fresh pool per scenario, so latency history from the previous run doesn't carry over
+    hedging._default_pool = hedging.ModelPool(hedging.parse_models(pool_spec), default_delay=args.hedge_delay)
+    jd = make_page(2000, html=False)
+    resume = "Abhinav Prasad\nSKILLS\nPython, Streamlit, LangChain"
+    with contextlib.redirect_stdout(io.StringIO()):
+        return run_scenario(lambda: email_generator.generate_application_email(jd, resume, use_cache=False),
+                            args.requests, args.concurrency)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the effect of hedged requests on tail latency.")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--tail-rate", type=float, default=0.05, help="Share of primary requests that stall")
+    parser.add_argument("--tail-latency", type=float, default=3.0)
+    parser.add_argument("--hedge-delay", type=float, default=0.5, help="Hedge delay until enough latency samples exist")
+    parser.add_argument("--max-calls", type=int, default=None,
+                        help="MAILGENIE_MAX_CONCURRENT_CALLS (default: twice --concurrency, leaving room for hedges)")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    primary = MockGroqServer(latency=0.1, jitter=0.02, tail_rate=args.tail_rate, tail_latency=args.tail_latency,
+                             token_limit=10000000).start()
+    secondary = MockGroqServer(latency=0.2, jitter=0.02, token_limit=10000000, seed=1).start()
+    os.environ.update({
+        "GROQ_API_KEY": "mock-key",
+        "GROQ_API_BASE": primary.base_url,
+        "MAILGENIE_CACHE_DISABLE": "1",
+        "MAILGENIE_DEDUPE_DISABLE": "1",
+        "MAILGENIE_RPM": "1000000",
+        "MAILGENIE_TPM": "10000000",
+        "MAILGENIE_MAX_CONCURRENT_CALLS": str(args.max_calls or 2 * args.concurrency),
+    })
+
+    report = {}
+    for name, spec in (("primary_only", f"mock-primary@{primary.base_url}"),
+                       ("hedged", f"mock-primary@{primary.base_url},mock-secondary@{secondary.base_url}")):
+        result = run(spec, args)
+        report[name] = result
+        print(f"{name:<13} p50={result['p50_s'] or 0:.3f}s p95={result['p95_s'] or 0:.3f}s "
+              f"p99={result['p99_s'] or 0:.3f}s errors={result['errors']}")
+    report["requests"] = {"primary": primary.requests, "secondary": secondary.requests}
+    print(f"requests served: primary {primary.requests}, secondary {secondary.requests}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
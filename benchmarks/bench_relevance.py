@@ -0,0 +1,40 @@
+##Micro-benchmark: BM25 relevance scoring of many JDs against one resume
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from relevance import score_jobs, select_jobs
+from bench_clean_text import make_page
+
+RESUME = """Abhinav Prasad
+abhinav@example.com
+SKILLS
+Python, Streamlit, LangChain, LLM integration, SQL, Docker, testing
+PROJECTS
+NAI tool: Streamlit dashboard for model deployment and testing
+EXPERIENCE
+AI intern: built LLM pipelines in Python and deployed them to the cloud
+"""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark local relevance scoring.")
+    parser.add_argument("--jobs", type=int, default=5000, help="Job descriptions to score")
+    parser.add_argument("--size", type=int, default=3000, help="Characters per job description")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    jobs = [make_page(args.size, html=False, seed=i) for i in range(args.jobs)]
+    score_jobs(RESUME, jobs[:10]) # warm the resume profile cache
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        scores = score_jobs(RESUME, jobs)
+        best = min(best, time.perf_counter() - started)
+    top = select_jobs(scores, top_k=10)
+    print(f"score_jobs: {args.jobs} JDs in {best * 1000:.0f} ms ({args.jobs / best:.0f}/s)")
+    print(f"top score {top[0]['score']:.3f}, 10th {top[-1]['score']:.3f}")
@@ -0,0 +1,90 @@
+##Cold-start and per-rerun overhead of the Streamlit app
+#
+# Run it on two revisions to compare, e.g.
+#   git stash; python benchmarks/bench_startup.py --output before.json; git stash pop
+#   python benchmarks/bench_startup.py --output after.json
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter so nothing is already imported
+COLD_START = """
+import time, json
+started = time.perf_counter()
+import chains
+imported = time.perf_counter()
+chain = chains.Chain()
+chain.llm
+ready = time.perf_counter()
+json.dump({"import_s": imported - started, "first_client_s": ready - imported}, open(OUT, "w"))
+"""
+
+
+def cold_start(repeat):
+    results = []
+    out = os.path.join(ROOT, ".bench_startup_tmp.json")
+    env = dict(os.environ, GROQ_API_KEY=os.getenv("GROQ_API_KEY", "bench-key"))
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", f"OUT = {out!r}\n" + COLD_START], cwd=ROOT, env=env, check=True)
+        wall = time.perf_counter() - started
+        with open(out) as f:
+            result = json.load(f)
+        result["process_s"] = wall
+        results.append(result)
+    os.remove(out)
+    return {key: min(r[key] for r in results) for key in results[0]}
+
+
+def chain_construction(repeat):
+    # Building a Chain per rerun was the old behaviour; with the shared client this should be ~free
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault("GROQ_API_KEY", "bench-key")
+    import chains
+
+    chains.Chain().llm
+    started = time.perf_counter()
+    for _ in range(repeat):
+        chains.Chain().llm
+    return (time.perf_counter() - started) / repeat
+
+
+def app_reruns(repeat):
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError as e:
+        return {"skipped": str(e)}
+
+    app = AppTest.from_file(os.path.join(ROOT, "main.py"), default_timeout=60)
+    started = time.perf_counter()
+    app.run()
+    first = time.perf_counter() - started
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        app.run()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {"first_run_s": first, "rerun_median_s": timings[len(timings) // 2], "rerun_min_s": timings[0]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure cold start and per-rerun overhead.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None, help="Optional JSON file for the results")
+    args = parser.parse_args()
+
+    report = {
+        "cold_start": cold_start(args.repeat),
+        "chain_construction_s": chain_construction(args.repeat * 10),
+        "app": app_reruns(args.repeat),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,182 @@
+##Local OpenAI-compatible stand-in for the Groq chat completions API
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+MOCK_JOB = {
+    "title": "Python/AI Developer",
+    "company": "GenCorp",
+    "role": "Mid-Level Developer",
+    "experience": "2+ years",
+    "skills": ["Python", "LLM integration", "Streamlit"],
+    "description": "Build and deploy LLM-powered tools and Streamlit dashboards.",
+}
+MOCK_EMAIL = (
+    "Subject: Application for Python/AI Developer at GenCorp\n\n"
+    "Dear Hiring Manager,\n\n"
+    "I am excited to apply for the Python/AI Developer role at GenCorp. My experience building "
+    "LLM-powered Streamlit tools maps directly onto your requirements.\n\n"
+    "I am available to join immediately, as I have completed all my academic coursework.\n\n"
+    "Best regards,\nAbhinav Prasad\nabhinav@example.com"
+)
+
+
+class MockGroqServer(ThreadingHTTPServer):
+    """
+    Serves POST /openai/v1/chat/completions (the path the Groq SDK and email_generator use) with
+    canned completions after a configurable delay. A share of requests can be answered with 429,
+    and `stream: true` requests get an SSE response split into small chunks.
+    """
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.2, jitter=0.05, error_rate=0.0,
+                 retry_after=0.1, chunk_delay=0.005, token_limit=6000, tail_rate=0.0, tail_latency=5.0, seed=0):
+        super().__init__(address, MockGroqHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.chunk_delay = chunk_delay
+        # Advertised per-minute token limit; the client's rate limiter adopts it
+        self.token_limit = token_limit
+        # A share of requests that take `tail_latency` seconds instead, to exercise hedging
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.requests = 0
+        self.rate_limited = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="mock-groq", daemon=True).start()
+        return self
+
+    def draw(self):
+        # Returns (should_rate_limit, delay) for one request
+        with self._lock:
+            self.requests += 1
+            limited = self._rng.random() < self.error_rate
+            if limited:
+                self.rate_limited += 1
+            delay = max(0.0, self._rng.gauss(self.latency, self.jitter))
+            if self._rng.random() < self.tail_rate:
+                delay = self.tail_latency
+        return limited, delay
+
+
+def completion_text(messages):
+    """Picks a canned answer that matches the prompt being asked."""
+    prompt = "\n".join(m.get("content", "") for m in messages)
+    if "VALID JSON" in prompt and "`email`" in prompt:
+        job = {k: v for k, v in MOCK_JOB.items() if k != "description"}
+        return json.dumps(dict(job, email=MOCK_EMAIL))
+    if "VALID JSON" in prompt:
+        return json.dumps(MOCK_JOB)
+    return MOCK_EMAIL
+
+
+class MockGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        limited, delay = self.server.draw()
+        if limited:
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+                            headers={"retry-after": str(self.server.retry_after)})
+            return
+
+        time.sleep(delay)
+        messages = payload.get("messages", [])
+        text = completion_text(messages)
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(text) // 4,
+                 "total_tokens": prompt_tokens + len(text) // 4}
+        model = payload.get("model", "mock-model")
+        headers = {
+            "x-ratelimit-limit-requests": "14400",
+            "x-ratelimit-remaining-requests": "14399",
+            "x-ratelimit-limit-tokens": str(self.server.token_limit),
+            "x-ratelimit-remaining-tokens": str(max(0, self.server.token_limit - usage["total_tokens"])),
+        }
+
+        if payload.get("stream"):
+            self._stream(text, model, usage, headers)
+            return
+
+        self._send_json(200, {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage,
+        }, headers=headers)
+
+    def _stream(self, text, model, usage, headers):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.close_connection = True
+        pieces = [text[i:i + 16] for i in range(0, len(text), 16)]
+        for i, piece in enumerate(pieces):
+            chunk = {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+            if i == len(pieces) - 1:
+                chunk["choices"][0]["finish_reason"] = "stop"
+                chunk["x_groq"] = {"usage": usage}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.server.chunk_delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local mock of the Groq chat completions API.")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--latency", type=float, default=0.2, help="Mean response delay in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="Share of requests delayed by --tail-latency")
+    parser.add_argument("--tail-latency", type=float, default=5.0)
+    args = parser.parse_args()
+
+    server = MockGroqServer(("127.0.0.1", args.port), latency=args.latency, error_rate=args.error_rate,
+                            tail_rate=args.tail_rate, tail_latency=args.tail_latency)
+    print(f"Mock Groq API listening on {server.base_url} (set GROQ_API_BASE to this URL)")
+    server.serve_forever()
@@ -0,0 +1,225 @@
+##Offline benchmark suite: drives the pipeline against local Groq and SMTP stand-ins
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import platform
+import tracemalloc
+import subprocess
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mock_groq import MockGroqServer, MOCK_EMAIL, MOCK_JOB
+from smtp_sink import SMTPSink
+from bench_clean_text import make_page
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, wall_time, errors=0):
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "p50_s": percentile(values, 50),
+        "p95_s": percentile(values, 95),
+        "p99_s": percentile(values, 99),
+        "mean_s": sum(values) / len(values) if values else None,
+        "wall_time_s": wall_time,
+        "throughput_per_s": len(values) / wall_time if wall_time else None,
+    }
+
+
+def run_scenario(fn, requests, concurrency):
+    """Calls `fn()` `requests` times on `concurrency` threads; a falsy result or exception is an error."""
+    def _timed(_):
+        started = time.perf_counter()
+        try:
+            ok = bool(fn())
+        except Exception:
+            ok = False
+        return ok, time.perf_counter() - started
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(_timed, range(requests)))
+    wall_time = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    summary = summarize([t for ok, t in results if ok], wall_time, errors=sum(1 for ok, _ in results if not ok))
+    summary["concurrency"] = concurrency
+    summary["peak_memory_mb"] = peak / 1e6
+    return summary
+
+
+def sweep(name, fn, requests, levels):
+    results = []
+    for level in levels:
+        result = run_scenario(fn, requests, level)
+        print(f"  {name:<28} c={level:<3} p50={result['p50_s'] or 0:.3f}s p95={result['p95_s'] or 0:.3f}s "
+              f"p99={result['p99_s'] or 0:.3f}s {result['throughput_per_s'] or 0:.1f}/s errors={result['errors']}")
+        results.append(result)
+    return results
+
+
+def bench_local(args):
+    from utils import clean_text
+
+    results = {}
+    page = make_page(args.page_size)
+    results["clean_text"] = sweep("clean_text", lambda: clean_text(page), args.local_iterations, [1])
+
+    from mailer import parse_llm_output
+    results["parse_llm_output"] = sweep("parse_llm_output", lambda: parse_llm_output(MOCK_EMAIL), args.local_iterations * 10, [1])
+    return results
+
+
+def bench_email_generator(args, levels):
+    import email_generator
+
+    jd = make_page(4000, html=False)
+    resume = "Abhinav Prasad\nSKILLS\nPython, Streamlit, LangChain\nPROJECTS\nNAI tool"
+    results = {}
+    # generate_application_email prints progress per call; keep it out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        results["generate_application_email"] = sweep(
+            "generate_application_email",
+            lambda: email_generator.generate_application_email(jd, resume, use_cache=False),
+            args.requests, levels)
+
+    ttfts, totals = [], []
+    for _ in range(args.stream_requests):
+        started = time.perf_counter()
+        first = None
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _token in email_generator.stream_application_email(jd, resume, use_cache=False):
+                if first is None:
+                    first = time.perf_counter() - started
+        if first is not None:
+            ttfts.append(first)
+            totals.append(time.perf_counter() - started)
+    results["stream_application_email"] = {
+        "time_to_first_token": summarize(ttfts, sum(totals)),
+        "total": summarize(totals, sum(totals)),
+    }
+    print(f"  {'stream_application_email':<28} ttft p50={percentile(sorted(ttfts), 50) or 0:.3f}s "
+          f"total p50={percentile(sorted(totals), 50) or 0:.3f}s")
+    return results
+
+
+def bench_chain(args, levels):
+    try:
+        from chains import Chain
+    except ImportError as e:
+        return {"skipped": str(e)}
+
+    chain = Chain()
+    jd = make_page(4000, html=False)
+    resume = "Abhinav Prasad\nSKILLS\nPython, Streamlit, LangChain\nPROJECTS\nNAI tool"
+    return {
+        "extract_jobs": sweep("Chain.extract_jobs", lambda: chain.extract_jobs(jd, use_cache=False), args.requests, levels),
+        "write_mail": sweep("Chain.write_mail", lambda: chain.write_mail(MOCK_JOB, resume, use_cache=False), args.requests, levels),
+        "extract_and_write": sweep("Chain.extract_and_write", lambda: chain.extract_and_write(jd, resume, use_cache=False), args.requests, levels),
+    }
+
+
+def bench_smtp(args, sink):
+    try:
+        import main
+        from mailer import build_email_message, get_sender
+    except ImportError as e:
+        return {"skipped": str(e)}
+
+    # The pooled sender itself: the app's outbox adds the provider pacing on top (a sleep), which
+    # would swamp the SMTP time being measured here
+    sender = get_sender(main.SMTP_SERVER, main.SMTP_PORT, "me@example.com", "app-password", use_ssl=main.SMTP_USE_SSL)
+
+    def _send():
+        sender.send(build_email_message("me@example.com", "recruiter@example.com", "Application", MOCK_EMAIL,
+                                        b"%PDF-1.4 mock", "resume.pdf"))
+        return True
+
+    connections_before = sink.connections
+    result = sweep("pooled SMTP send", _send, args.smtp_messages, [1])
+    return {
+        "smtp_send": result,
+        "smtp_connections": sink.connections - connections_before,
+        "messages_received": sink.messages,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the MailGenie pipeline offline against local stand-ins.")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mean mock LLM response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Standard deviation of the mock delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of mock LLM requests answered with 429")
+    parser.add_argument("--token-limit", type=int, default=10000000,
+                        help="Per-minute token limit the mock advertises (Groq's free tier is 6000)")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=32, help="LLM requests per concurrency level")
+    parser.add_argument("--stream-requests", type=int, default=5)
+    parser.add_argument("--smtp-messages", type=int, default=20)
+    parser.add_argument("--local-iterations", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=500000, help="Characters in the synthetic page fed to clean_text")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    mock = MockGroqServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                          token_limit=args.token_limit).start()
+    sink = SMTPSink().start()
+
+    # Point every client at the stand-ins before the app modules read their configuration
+    os.environ.update({
+        "GROQ_API_KEY": "mock-key",
+        "GROQ_API_BASE": mock.base_url,
+        "MAILGENIE_CACHE_DISABLE": "1",
+        # Measure the pipeline, not the client-side pacing; --token-limit controls throttling
+        "MAILGENIE_RPM": "1000000",
+        "MAILGENIE_TPM": str(args.token_limit),
+        "SMTP_SERVER": "127.0.0.1",
+        "SMTP_PORT": str(sink.port),
+        "SMTP_USE_SSL": "0",
+    })
+
+    print(f"Mock Groq API at {mock.base_url}, SMTP sink on port {sink.port}")
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "results": {},
+    }
+    report["results"]["local"] = bench_local(args)
+    report["results"]["email_generator"] = bench_email_generator(args, levels)
+    report["results"]["chain"] = bench_chain(args, levels)
+    report["results"]["smtp"] = bench_smtp(args, sink)
+    report["mock"] = {"requests": mock.requests, "rate_limited": mock.rate_limited}
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    scale = 1e6 if sys.platform == "darwin" else 1e3
+    report["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
@@ -0,0 +1,91 @@
+##Minimal local SMTP sink that accepts and discards every message
+import argparse
+import threading
+import socketserver
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP (EHLO, AUTH PLAIN/LOGIN, MAIL, RCPT, DATA, NOOP, RSET, QUIT) for smtplib."""
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode("ascii"))
+
+    def handle(self):
+        self.reply("220 localhost MailGenie SMTP sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250-localhost")
+                self.reply("250-AUTH PLAIN LOGIN")
+                self.reply("250 SIZE 52428800")
+            elif verb == "AUTH":
+                parts = command.split()
+                if len(parts) > 1 and parts[1].upper() == "LOGIN":
+                    # AUTH LOGIN sends the username and password on separate lines
+                    for prompt in ("334 VXNlcm5hbWU6", "334 UGFzc3dvcmQ6"):
+                        if len(parts) > 2 and prompt.endswith("bWU6"):
+                            continue
+                        self.reply(prompt)
+                        self.rfile.readline()
+                self.server.logins += 1
+                self.reply("235 2.7.0 Authentication successful")
+            elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b".\r\n", b".\n"):
+                        break
+                    size += len(data)
+                with self.server.lock:
+                    self.server.messages += 1
+                    self.server.bytes_received += size
+                self.reply("250 OK: queued")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Counts connections, logins and messages so benchmarks can check what was sent."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("127.0.0.1", 0)):
+        super().__init__(address, SMTPSinkHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.logins = 0
+        self.messages = 0
+        self.bytes_received = 0
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="smtp-sink", daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local SMTP sink.")
+    parser.add_argument("--port", type=int, default=8025)
+    args = parser.parse_args()
+
+    sink = SMTPSink(("127.0.0.1", args.port))
+    print(f"SMTP sink listening on 127.0.0.1:{sink.port} (set SMTP_SERVER=127.0.0.1 SMTP_PORT={sink.port} SMTP_USE_SSL=0)")
+    sink.serve_forever()
@@ -0,0 +1,149 @@
+##Persistent response cache for LLM calls
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# Chain runs at temperature=0, so the same model + prompt + inputs always produce the same
+# output. Caching on a hash of those lets a repeated request skip the Groq round trip.
+DEFAULT_CACHE_PATH = os.getenv("MAILGENIE_CACHE_PATH", ".mailgenie_cache.sqlite3")
+DEFAULT_MAX_ENTRIES = 2000
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024 # 50 MB of stored responses
+DEFAULT_MAX_AGE = 30 * 24 * 3600 # 30 days
+
+
+class ResponseCache:
+    """
+    SQLite-backed, content-addressed cache with LRU eviction by entry count, total size and age.
+
+    Safe to share between threads (e.g. the batch workers in email_generator.py).
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE, enabled=True):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        # Setting MAILGENIE_CACHE_DISABLE=1 bypasses the cache for the whole process
+        self.enabled = enabled and os.getenv("MAILGENIE_CACHE_DISABLE", "") not in ("1", "true", "yes")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model, template, **inputs):
+        """Builds a stable cache key from the model name, prompt template and prompt inputs."""
+        payload = json.dumps({"model": model, "template": template, "inputs": inputs}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Returns the cached value for `key`, or None on a miss (or when the cache is bypassed)."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.max_age and now - row[1] > self.max_age):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def get_any(self, keys):
+        """
+        Returns the value of the first of `keys` that is cached, or None. Counts as one hit or
+        one miss however many keys are tried (e.g. one key per model of the pool).
+        """
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                row = self._conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None and not (self.max_age and now - row[1] > self.max_age):
+                    self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                    self._conn.commit()
+                    self.hits += 1
+                    return json.loads(row[0])
+            self.misses += 1
+        return None
+
+    def contains(self, key):
+        """True if a live entry exists for `key`; unlike get() it leaves the stats and LRU order alone."""
+        if not self.enabled:
+            return False
+        with self._lock:
+            row = self._conn.execute("SELECT created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        return row is not None and not (self.max_age and time.time() - row[0] > self.max_age)
+
+    def set(self, key, value):
+        """Stores a JSON-serialisable value under `key` and evicts entries over the limits."""
+        if not self.enabled:
+            return
+        data = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        # Drop expired rows first, then least-recently-used rows beyond the count/size limits
+        if self.max_age:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.max_age,))
+        kept = total = 0
+        stale = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access DESC"):
+            kept += 1
+            total += size
+            if (self.max_entries and kept > self.max_entries) or (self.max_bytes and total > self.max_bytes):
+                stale.append((key,))
+        if stale:
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def clear(self):
+        """Removes every cached response."""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self):
+        """Returns hit/miss counters and current size of the cache."""
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size, "enabled": self.enabled}
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Returns the process-wide ResponseCache, opening it on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
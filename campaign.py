@@ -0,0 +1,633 @@
+##Durable, resumable campaign queue for drafting and sending applications
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Every item moves forward through these stages; its outputs are stored as each one completes,
+# so a crash or a browser refresh resumes from the last finished stage instead of from scratch.
+STAGES = ("queued", "cleaned", "extracted", "drafted", "approved", "sent")
+STAGE_RANK = {stage: rank for rank, stage in enumerate(STAGES)}
+DEFAULT_CAMPAIGN_PATH = os.getenv("MAILGENIE_CAMPAIGN_PATH", ".mailgenie_campaigns.sqlite3")
+# Rows fetched per query when iterating, so large campaigns are never loaded into memory at once
+PAGE_SIZE = 500
+DEFAULT_WORKERS = 4
+# Messages handed to the outbox ahead of the one being sent; the rest wait in the store
+SEND_WINDOW = 8
+
+# Columns callers may write when advancing an item
+ITEM_FIELDS = ("cleaned_text", "job", "email", "subject", "body", "recipient", "recipient_name")
+
+
+def make_item_key(text):
+    """Content-derived item key, so re-adding the same job description is a no-op."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def make_send_key(campaign, item_key, recipient):
+    """Idempotency key for one message: the same campaign item is never mailed to the same address twice."""
+    payload = json.dumps([campaign, item_key, recipient.strip().lower()])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CampaignStore:
+    """
+    SQLite-backed job store: one row per job description with its current stage and outputs.
+
+    Safe to share between threads; WAL mode lets the CLI and the Streamlit app use the same
+    file. Sends are claimed in a separate table keyed by make_send_key before the SMTP call,
+    which makes sending at-most-once even across restarts.
+    """
+
+    def __init__(self, path=DEFAULT_CAMPAIGN_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                campaign TEXT NOT NULL,
+                item_key TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                stage_rank INTEGER NOT NULL,
+                source_text TEXT NOT NULL,
+                cleaned_text TEXT,
+                job TEXT,
+                email TEXT,
+                subject TEXT,
+                body TEXT,
+                recipient TEXT,
+                recipient_name TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                UNIQUE (campaign, item_key)
+            );
+            CREATE INDEX IF NOT EXISTS idx_items_stage ON items(campaign, stage_rank, id);
+            CREATE TABLE IF NOT EXISTS sends (
+                send_key TEXT PRIMARY KEY,
+                item_id INTEGER NOT NULL,
+                recipient TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                sent_at REAL
+            );
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _to_dict(row):
+        item = dict(row)
+        item["job"] = json.loads(item["job"]) if item["job"] else None
+        return item
+
+    def add_item(self, campaign, source_text, item_key=None, recipient=None, recipient_name=None):
+        """Queues one job description; returns its row id (the existing one if it was already queued)."""
+        item_key = item_key or make_item_key(source_text)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO items (campaign, item_key, stage, stage_rank, source_text, recipient,"
+                " recipient_name, created_at, updated_at) VALUES (?, ?, 'queued', 0, ?, ?, ?, ?, ?)",
+                (campaign, item_key, source_text, recipient, recipient_name, now, now)
+            )
+            self._conn.commit()
+            row = self._conn.execute("SELECT id FROM items WHERE campaign = ? AND item_key = ?", (campaign, item_key)).fetchone()
+        return row["id"]
+
+    def add_items(self, campaign, records, batch_size=PAGE_SIZE):
+        """
+        Queues many items from an iterable of (item_key, source_text) pairs or dicts with
+        `job_description` / `id` / `recipient` / `recipient_name`, committing in batches.
+        Returns the number of newly queued items.
+        """
+        added = 0
+        batch = []
+
+        def _flush():
+            nonlocal added
+            with self._lock:
+                before = self._conn.total_changes
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO items (campaign, item_key, stage, stage_rank, source_text, recipient,"
+                    " recipient_name, created_at, updated_at) VALUES (?, ?, 'queued', 0, ?, ?, ?, ?, ?)",
+                    batch
+                )
+                self._conn.commit()
+                added += self._conn.total_changes - before
+            batch.clear()
+
+        for record in records:
+            if isinstance(record, dict):
+                text = record.get("job_description") or record.get("text") or ""
+                key, recipient, recipient_name = record.get("id"), record.get("recipient"), record.get("recipient_name")
+            else:
+                (key, text), recipient, recipient_name = record, None, None
+            if not text.strip():
+                continue
+            now = time.time()
+            batch.append((campaign, str(key) if key is not None else make_item_key(text), text, recipient, recipient_name, now, now))
+            if len(batch) >= batch_size:
+                _flush()
+        if batch:
+            _flush()
+        return added
+
+    def get(self, item_id):
+        """Returns one item by row id, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM items WHERE id = ?", (item_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def iter_items(self, campaign, stages=None, batch_size=PAGE_SIZE):
+        """Yields items (optionally only those in `stages`) page by page in insertion order."""
+        ranks = sorted(STAGE_RANK[s] for s in (stages or STAGES))
+        placeholders = ",".join("?" * len(ranks))
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT * FROM items WHERE campaign = ? AND stage_rank IN ({placeholders}) AND id > ?"
+                    " ORDER BY id LIMIT ?",
+                    (campaign, *ranks, last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield self._to_dict(row)
+            last_id = rows[-1]["id"]
+
+    def advance(self, item_id, stage, **fields):
+        """Moves an item to `stage` and stores its outputs. Items never move backwards."""
+        unknown = set(fields) - set(ITEM_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown item fields: {', '.join(sorted(unknown))}")
+        if "job" in fields and fields["job"] is not None:
+            fields["job"] = json.dumps(fields["job"])
+        assignments = "".join(f", {name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE items SET stage = ?, stage_rank = ?, error = NULL, updated_at = ?{assignments}"
+                " WHERE id = ? AND stage_rank <= ?",
+                (stage, STAGE_RANK[stage], time.time(), *fields.values(), item_id, STAGE_RANK[stage])
+            )
+            self._conn.commit()
+
+    def update(self, item_id, **fields):
+        """Edits stored outputs (e.g. a reviewed subject/body) without changing the stage."""
+        if not fields:
+            return
+        unknown = set(fields) - set(ITEM_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown item fields: {', '.join(sorted(unknown))}")
+        if "job" in fields and fields["job"] is not None:
+            fields["job"] = json.dumps(fields["job"])
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE items SET {assignments}, updated_at = ? WHERE id = ?",
+                (*fields.values(), time.time(), item_id)
+            )
+            self._conn.commit()
+
+    def record_error(self, item_id, error):
+        """Records a failed attempt; the item stays at its last completed stage and is retried on resume."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE items SET error = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (str(error), time.time(), item_id)
+            )
+            self._conn.commit()
+
+    def counts(self, campaign):
+        """Returns {stage: count} plus the number of items carrying an error."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage, COUNT(*) AS n, SUM(error IS NOT NULL) AS failed FROM items WHERE campaign = ? GROUP BY stage",
+                (campaign,)
+            ).fetchall()
+        counts = {stage: 0 for stage in STAGES}
+        counts["errors"] = 0
+        for row in rows:
+            counts[row["stage"]] = row["n"]
+            counts["errors"] += row["failed"] or 0
+        return counts
+
+    def claim_send(self, item, recipient):
+        """
+        Reserves the (campaign, item, recipient) send before any SMTP traffic.
+
+        Returns True if the caller may send. Returns False if that message was already sent
+        or a send is in flight (or was interrupted mid-send, which is not retried blindly).
+        """
+        send_key = make_send_key(item["campaign"], item["item_key"], recipient)
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO sends (send_key, item_id, recipient, status, created_at) VALUES (?, ?, ?, 'sending', ?)",
+                (send_key, item["id"], recipient.strip().lower(), time.time())
+            )
+            self._conn.commit()
+        return cursor.rowcount == 1
+
+    def complete_send(self, item, recipient):
+        """Marks a claimed send as delivered and the item as sent."""
+        send_key = make_send_key(item["campaign"], item["item_key"], recipient)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("UPDATE sends SET status = 'sent', sent_at = ? WHERE send_key = ?", (now, send_key))
+            self._conn.execute(
+                "UPDATE items SET stage = 'sent', stage_rank = ?, recipient = ?, error = NULL, updated_at = ? WHERE id = ?",
+                (STAGE_RANK["sent"], recipient, now, item["id"])
+            )
+            self._conn.commit()
+
+    def release_send(self, item, recipient, error=None):
+        """Drops a claim after a send that definitely did not go out (e.g. bad credentials)."""
+        send_key = make_send_key(item["campaign"], item["item_key"], recipient)
+        with self._lock:
+            self._conn.execute("DELETE FROM sends WHERE send_key = ? AND status = 'sending'", (send_key,))
+            self._conn.commit()
+        if error is not None:
+            self.record_error(item["id"], error)
+
+    def unconfirmed_sends(self, campaign):
+        """Returns the sends of `campaign` still marked `sending` (interrupted or of unknown outcome)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT s.item_id, s.recipient, s.created_at FROM sends s JOIN items i ON i.id = s.item_id "
+                "WHERE i.campaign = ? AND s.status = 'sending' ORDER BY s.created_at",
+                (campaign,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def resolve_send(self, item, sent):
+        """
+        Settles an unconfirmed send of `item` once its outcome is known (e.g. after checking the
+        Sent folder): sent=True marks it delivered, sent=False releases the claim so it is
+        sent again next time. Returns the recipient, or None if nothing was pending.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT recipient FROM sends WHERE item_id = ? AND status = 'sending'", (item["id"],)
+            ).fetchone()
+        if row is None:
+            return None
+        if sent:
+            self.complete_send(item, row["recipient"])
+        else:
+            self.release_send(item, row["recipient"])
+        return row["recipient"]
+
+    def send_status(self, item, recipient):
+        """Returns 'sent', 'sending' or None for this item and recipient."""
+        send_key = make_send_key(item["campaign"], item["item_key"], recipient)
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM sends WHERE send_key = ?", (send_key,)).fetchone()
+        return row["status"] if row else None
+
+
+def process_item(store, item, llm, resume_data, clean_text, use_cache=True):
+    """
+    Runs one item from its current stage up to `drafted`, checkpointing after every stage.
+    Returns the updated item.
+    """
+    if item["stage_rank"] < STAGE_RANK["cleaned"]:
+        item["cleaned_text"] = clean_text(item["source_text"])
+        store.advance(item["id"], "cleaned", cleaned_text=item["cleaned_text"])
+    if item["stage_rank"] < STAGE_RANK["extracted"]:
+        jobs = llm.extract_jobs(item["cleaned_text"], use_cache=use_cache)
+        if not jobs:
+            raise ValueError("Could not extract job details from the description.")
+        # One row per job description; the first posting found is the one drafted for
+        item["job"] = jobs[0]
+        store.advance(item["id"], "extracted", job=item["job"])
+    if item["stage_rank"] < STAGE_RANK["drafted"]:
+        item["email"] = llm.write_mail(item["job"], resume_data, use_cache=use_cache)
+        store.advance(item["id"], "drafted", email=item["email"])
+    return store.get(item["id"])
+
+
+def rank_pending(store, campaign, resume_data, top_k=None, min_score=0):
+    """
+    Scores every item of `campaign` that has not been drafted yet against the resume with the
+    local relevance prefilter, before any LLM call, and returns the worthwhile ones best first
+    (relevance.select_jobs): each score dict gains "item_id" and "item_key". Returns
+    (selected, scored). The score of a JD doesn't depend on the others, so items are scored a
+    page at a time; only scores, not texts, are kept.
+    """
+    import heapq
+    from relevance import score_jobs
+
+    kept, scored = [], 0
+
+    def _score(page):
+        nonlocal scored
+        for item, score in zip(page, score_jobs(resume_data, [i["cleaned_text"] or i["source_text"] for i in page])):
+            scored += 1
+            if score["score"] < (min_score or 0):
+                continue
+            score.update(item_id=item["id"], item_key=item["item_key"])
+            entry = (score["score"], score["bm25"], -item["id"], score)
+            if not top_k or len(kept) < top_k:
+                heapq.heappush(kept, entry)
+            else:
+                heapq.heappushpop(kept, entry)
+
+    page = []
+    for item in store.iter_items(campaign, stages=("queued", "cleaned", "extracted")):
+        page.append(item)
+        if len(page) >= PAGE_SIZE:
+            _score(page)
+            page = []
+    if page:
+        _score(page)
+    return [entry[-1] for entry in sorted(kept, reverse=True)], scored
+
+
+def run_pending(store, campaign, llm, resume_data, clean_text, max_workers=DEFAULT_WORKERS, use_cache=True, on_done=None, item_ids=None):
+    """
+    Drafts every item of `campaign` (or just `item_ids`, e.g. those picked by rank_pending) that
+    has not reached `drafted` yet, resuming each from its last completed stage. At most
+    `max_workers * 2` items are held in memory at a time.
+
+    on_done(item, error) is called from this thread as each item finishes.
+    Returns {"drafted": n, "failed": n}.
+    """
+    drafted = failed = 0
+    pending = store.iter_items(campaign, stages=("queued", "cleaned", "extracted"))
+    if item_ids is not None:
+        item_ids = set(item_ids)
+        pending = (item for item in pending if item["id"] in item_ids)
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as pool:
+        in_flight = {}
+        while True:
+            # Keep a bounded window of submitted items instead of submitting the whole campaign
+            while len(in_flight) < max_workers * 2:
+                item = next(pending, None)
+                if item is None:
+                    break
+                in_flight[pool.submit(process_item, store, item, llm, resume_data, clean_text, use_cache)] = item
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = in_flight.pop(future)
+                try:
+                    item, error = future.result(), None
+                    drafted += 1
+                except Exception as e:
+                    store.record_error(item["id"], e)
+                    error = e
+                    failed += 1
+                if on_done:
+                    on_done(item, error)
+    return {"drafted": drafted, "failed": failed}
+
+
+def item_message(item, sender_email, pdf_attachment_data=None, pdf_filename=None):
+    """Builds the EmailMessage for an approved item from its reviewed subject/body (or its raw draft)."""
+    from mailer import build_email_message, parse_llm_output
+
+    subject, body = item["subject"], item["body"]
+    if not (subject and body):
+        subject, body = parse_llm_output(item["email"] or "")
+    return build_email_message(sender_email, item["recipient"], subject, body, pdf_attachment_data, pdf_filename)
+
+
+def send_approved(store, campaign, outbox, build_message, item_ids=None, on_done=None):
+    """
+    Sends every approved item of `campaign` that has a recipient (or just `item_ids`) through
+    `outbox`, which paces them to the provider's rate limit on its background worker.
+
+    Only SEND_WINDOW messages are queued at a time, and each send is claimed on the outbox worker
+    right before its SMTP call, so nothing already sent or in flight goes out again and a crash
+    leaves at most the message being sent unconfirmed; the others are still `approved` and go out
+    on the next run. A send that certainly failed (e.g. bad credentials) releases its claim and
+    is retried next time; one whose outcome is unknown stays `sending` until settled with
+    CampaignStore.resolve_send (`campaign.py resolve`).
+    build_message(item) returns the EmailMessage; on_done(item, result) gets each attempted
+    mailer.SendResult. Returns {"sent", "failed", "unknown", "skipped"} counts.
+    """
+    counts = {"sent": 0, "failed": 0, "unknown": 0, "skipped": 0}
+    items = (store.get(i) for i in item_ids) if item_ids else store.iter_items(campaign, stages=("approved",))
+    window = deque()
+    for item in items:
+        if not item or item["campaign"] != campaign or item["stage"] != "approved" or not item["recipient"]:
+            counts["skipped"] += 1
+            continue
+        if store.send_status(item, item["recipient"]) is not None:
+            counts["skipped"] += 1
+            continue
+        try:
+            msg = build_message(item)
+        except Exception as e:
+            store.record_error(item["id"], e)
+            counts["failed"] += 1
+            continue
+        window.append((item, outbox.put(msg, before_send=lambda item=item: store.claim_send(item, item["recipient"]))))
+        if len(window) >= SEND_WINDOW:
+            _finish_send(store, *window.popleft(), counts, on_done)
+    while window:
+        _finish_send(store, *window.popleft(), counts, on_done)
+    return counts
+
+
+def _finish_send(store, item, result, counts, on_done):
+    # Waits for one queued message and records its outcome in the store
+    result.done.wait()
+    if result.skipped:
+        # Claimed elsewhere meanwhile, or the claim itself failed
+        if result.error:
+            store.record_error(item["id"], result.error)
+            counts["failed"] += 1
+        else:
+            counts["skipped"] += 1
+        return
+    if result.ok:
+        store.complete_send(item, item["recipient"])
+        counts["sent"] += 1
+    elif result.not_sent:
+        store.release_send(item, item["recipient"], error=result.error)
+        counts["failed"] += 1
+    else:
+        store.record_error(item["id"], f"send outcome unknown: {result.error}")
+        counts["unknown"] += 1
+    if on_done:
+        on_done(item, result)
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_store():
+    """Returns the process-wide CampaignStore, opening it on first use."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = CampaignStore()
+        return _default_store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage resumable MailGenie campaigns.")
+    parser.add_argument("--db", default=DEFAULT_CAMPAIGN_PATH, help="Campaign database file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="Queue job descriptions from a directory or a JSONL file")
+    add.add_argument("campaign")
+    add.add_argument("source", help="Directory of JD files, or JSONL with job_description/id/recipient fields")
+
+    run = commands.add_parser("run", help="Draft every queued item, resuming from the last completed stage")
+    run.add_argument("campaign")
+    run.add_argument("resume", help="Resume text or PDF file")
+    run.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    run.add_argument("--no-cache", action="store_true", help="Bypass the on-disk response cache")
+    run.add_argument("--top-k", type=int, default=None, help="Only draft the K items most relevant to the resume")
+    run.add_argument("--min-score", type=float, default=None, help="Skip items whose local relevance score (0-1) is below this")
+
+    status = commands.add_parser("status", help="Show how many items are in each stage")
+    status.add_argument("campaign")
+
+    approve = commands.add_parser("approve", help="Approve drafted items for sending")
+    approve.add_argument("campaign")
+    approve.add_argument("ids", nargs="*", type=int, help="Item ids to approve (default: every drafted item)")
+
+    send = commands.add_parser("send", help="Send approved items to their recipients, at most once each")
+    send.add_argument("campaign")
+    send.add_argument("sender", help="Sender email address (password from EMAIL_PASSWORD)")
+    send.add_argument("--attach", help="Resume PDF to attach to every message")
+    send.add_argument("ids", nargs="*", type=int, help="Item ids to send (default: every approved item with a recipient)")
+
+    unconfirmed = commands.add_parser("unconfirmed", help="List sends that were started but never confirmed")
+    unconfirmed.add_argument("campaign")
+
+    resolve = commands.add_parser("resolve", help="Settle unconfirmed sends after checking your Sent folder")
+    resolve.add_argument("campaign")
+    resolve.add_argument("outcome", choices=("sent", "not-sent"), help="sent: mark delivered; not-sent: release so the next send retries")
+    resolve.add_argument("ids", nargs="+", type=int, help="Item ids to settle")
+
+    export = commands.add_parser("export", help="Write items as JSON lines to stdout")
+    export.add_argument("campaign")
+    export.add_argument("--stage", action="append", choices=STAGES, help="Only export items in this stage")
+
+    args = parser.parse_args()
+    store = CampaignStore(args.db)
+
+    if args.command == "add":
+        if os.path.isdir(args.source):
+            from email_generator import load_job_descriptions
+            records = load_job_descriptions(args.source)
+        else:
+            def _jsonl(path):
+                with open(path, "r") as f:
+                    for line in f:
+                        if line.strip():
+                            yield json.loads(line)
+            records = _jsonl(args.source)
+        print(f"Queued {store.add_items(args.campaign, records)} new items in '{args.campaign}'.")
+
+    elif args.command == "run":
+        from chains import get_chain
+        from utils import clean_text
+
+        from resume_profile import load_resume
+
+        resume_data = load_resume(args.resume)
+
+        # Rank the undrafted items against the resume locally and only spend LLM calls on the worthwhile ones
+        from relevance import DEFAULT_MIN_SCORE, DEFAULT_TOP_K, format_score
+
+        top_k = DEFAULT_TOP_K if args.top_k is None else args.top_k
+        min_score = DEFAULT_MIN_SCORE if args.min_score is None else args.min_score
+        item_ids = None
+        if top_k or min_score:
+            selected, scored = rank_pending(store, args.campaign, resume_data, top_k=top_k, min_score=min_score)
+            print(f"\n--- Relevance ranking ({len(selected)} of {scored} items selected) ---")
+            for score in selected:
+                print(f"+ [{score['item_id']}] {score['item_key']}: {format_score(score)}")
+            item_ids = [score["item_id"] for score in selected]
+
+        def _report(item, error):
+            label = item.get("job", {}).get("title") if item.get("job") else item["item_key"]
+            print(f"[{item['id']}] {'FAILED: ' + str(error) if error else 'drafted'} ({label})")
+
+        summary = run_pending(store, args.campaign, get_chain(), resume_data, clean_text,
+                              max_workers=args.workers, use_cache=not args.no_cache, on_done=_report, item_ids=item_ids)
+        print(f"Drafted {summary['drafted']} items, {summary['failed']} failed (re-run to retry them).")
+
+    elif args.command == "status":
+        counts = store.counts(args.campaign)
+        for stage in STAGES:
+            print(f"{stage:>10}: {counts[stage]}")
+        print(f"{'errors':>10}: {counts['errors']}")
+
+    elif args.command == "approve":
+        approved = 0
+        items = (store.get(i) for i in args.ids) if args.ids else store.iter_items(args.campaign, stages=("drafted",))
+        for item in items:
+            if item and item["campaign"] == args.campaign and item["stage"] == "drafted":
+                store.advance(item["id"], "approved")
+                approved += 1
+        print(f"Approved {approved} items.")
+
+    elif args.command == "send":
+        import smtplib
+        from mailer import Outbox, get_sender
+
+        password = os.getenv("EMAIL_PASSWORD")
+        if not password:
+            print("Error: EMAIL_PASSWORD environment variable not set.")
+            sys.exit(1)
+        pdf_data = pdf_name = None
+        if args.attach:
+            with open(args.attach, "rb") as f:
+                pdf_data, pdf_name = f.read(), os.path.basename(args.attach)
+        sender = get_sender(os.getenv("SMTP_SERVER", "smtp.gmail.com"), int(os.getenv("SMTP_PORT", "465")), args.sender, password,
+                            use_ssl=os.getenv("SMTP_USE_SSL", "1") not in ("0", "false", "no"))
+        try:
+            # Fail fast on bad credentials instead of failing (and logging in again for) every message
+            sender.connect()
+        except smtplib.SMTPAuthenticationError as e:
+            print(f"Error: authentication failed for {args.sender}: {e}")
+            sys.exit(1)
+        except (smtplib.SMTPException, OSError) as e:
+            print(f"Error: could not connect to {sender.host}:{sender.port}: {e}")
+            sys.exit(1)
+        outbox = Outbox(sender)
+
+        def _report(item, result):
+            outcome = "sent" if result.ok else ("FAILED (will retry): " if result.not_sent else "UNKNOWN (check Sent folder): ") + str(result.error)
+            print(f"[{item['id']}] {result.recipient}: {outcome}")
+
+        summary = send_approved(store, args.campaign, outbox, lambda item: item_message(item, args.sender, pdf_data, pdf_name),
+                                item_ids=args.ids, on_done=_report)
+        print(f"Sent {summary['sent']}, failed {summary['failed']}, unknown {summary['unknown']}, skipped {summary['skipped']} "
+              f"(paced to {outbox.rate_per_minute}/min).")
+        sender.close()
+
+    elif args.command == "unconfirmed":
+        for send in store.unconfirmed_sends(args.campaign):
+            started = time.strftime("%Y-%m-%d %H:%M", time.localtime(send["created_at"]))
+            print(f"[{send['item_id']}] {send['recipient']} (started {started})")
+
+    elif args.command == "resolve":
+        for item_id in args.ids:
+            item = store.get(item_id)
+            recipient = store.resolve_send(item, args.outcome == "sent") if item and item["campaign"] == args.campaign else None
+            print(f"[{item_id}] {recipient + ': ' + args.outcome if recipient else 'no unconfirmed send'}")
+
+    elif args.command == "export":
+        for item in store.iter_items(args.campaign, stages=args.stage):
+            sys.stdout.write(json.dumps(item) + "\n")
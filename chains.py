@@ -1,27 +1,22 @@
 import os
+import threading
+from functools import lru_cache
 os.environ["LANGCHAIN_TRACING_V2"] = "false"
 
-from langchain_groq import ChatGroq
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
-from langchain_core.exceptions import OutputParserException
-from dotenv import load_dotenv
+import metrics
+from cache import get_cache
+from hedging import Cancelled, get_model_pool
+from json_repair import parse_records
+from ratelimit import COMPLETION_TOKEN_ESTIMATE, MAX_ATTEMPTS, call_slot, get_limiter
+from resume_profile import estimate_tokens, prepare_resume, trim_job_description
 
-load_dotenv()
+# The LangChain/Groq stack is imported on first use rather than at module load, so importing
+# this module (e.g. on every Streamlit rerun) stays cheap.
 
-class Chain:
-    def __init__(self):
-        # Using llama-3.3-70b-versatile for complex reasoning/writing tasks
-        self.llm = ChatGroq(
-        model_name="llama-3.3-70b-versatile",
-        api_key=os.getenv("GROQ_API_KEY"),
-        temperature=0
-        )
-        
-    def extract_jobs(self, cleaned_text):
-        # This prompt extracts structured data (Title, Company, Skills) from the JD.
-        prompt_extract = PromptTemplate.from_template(
-            """
+MODEL_NAME = "llama-3.3-70b-versatile"
+
+# This prompt extracts structured data (Title, Company, Skills) from the JD.
+EXTRACT_PROMPT = """
             ### SCRAPED TEXT (JOB DESCRIPTION):
             {page_data}
             ### INSTRUCTION:
@@ -30,23 +25,9 @@ class Chain:
             Ensure the JSON is valid and contains ALL provided keys. If a key is not explicitly mentioned, use "N/A".
             ### VALID JSON (NO PREAMBLE):
             """
-        )
-        chain_extract = prompt_extract | self.llm
-        res = chain_extract.invoke(input={"page_data": cleaned_text})
-        try:
-            json_parser = JsonOutputParser()
-            res = json_parser.parse(res.content)
-        except OutputParserException:
-            # Added more specific context to the error message
-            raise OutputParserException("Could not parse the job description into structured JSON. Try shortening the input.")
-        # Ensure the output is always iterable (a list), even if only one job is returned
-        return res if isinstance(res, list) else [res]
 
-    # CORRECTED: Function signature now accepts 'resume_data' instead of 'links'
-    def write_mail(self, job, resume_data):
-        # This prompt generates the final email using the extracted job details and the raw resume text.
-        prompt_email = PromptTemplate.from_template(
-            """
+# This prompt generates the final email using the extracted job details and the raw resume text.
+EMAIL_PROMPT = """
             ### CANDIDATE RESUME:
             {resume_data}
 
@@ -66,11 +47,346 @@ class Chain:
 
             ### COLD EMAIL DRAFT:
             """
+
+# Fused mode: structures the JD and drafts the email in one call, so the resume is sent once
+# and the job details never have to be round-tripped back into a second prompt.
+FUSED_PROMPT = """
+            ### CANDIDATE RESUME:
+            {resume_data}
+
+            ### SCRAPED TEXT (JOB DESCRIPTION):
+            {page_data}
+
+            ### INSTRUCTION:
+            You are a skilled applicant, Abhinav Prasad, applying for the job described above.
+            First extract the job posting details, then write a highly tailored, professional application email to the hiring manager.
+
+            Use the following rules for the email:
+            1. The email must be written **from the perspective of Abhinav Prasad**.
+            2. The email must be concise (max 4-5 short paragraphs).
+            3. **Critically analyze** the job requirements and **directly correlate** Abhinav's skills, projects, and work experience from the 'CANDIDATE RESUME' to them. Mention specific projects or achievements where possible.
+            4. Start with a compelling subject line on its own line, in the form "Subject: ...".
+            5. End with a professional closing and Abhinav Prasad's full contact block (Email, Phone, LinkedIn/GitHub/Portfolio links if available in the resume).
+
+            Return a single JSON object containing the following keys: `title`, `company`, `role`, `experience`, `skills` and `email`.
+            `email` holds the complete email (subject line + body) as one string. If a job detail is not explicitly mentioned, use "N/A".
+            ### VALID JSON (NO PREAMBLE):
+            """
+
+# Keys every structured answer is checked for; missing ones are filled with "N/A"
+JOB_KEYS = ("title", "company", "role", "experience", "skills", "description")
+FUSED_KEYS = ("title", "company", "role", "experience", "skills", "email")
+
+# Sent only when local repair of a structured answer fails: just the broken output goes back,
+# not the job description and resume, so the re-ask is a small call
+REPAIR_PROMPT = """
+            ### MALFORMED OUTPUT:
+            {output}
+
+            ### PROBLEM:
+            {error}
+
+            ### INSTRUCTION:
+            The output above was meant to be valid JSON with the keys {keys}, but it could not be parsed.
+            Return the same content as corrected JSON only: no preamble, no code fences, no comments.
+            Use "N/A" for any key that has no value.
+            ### CORRECTED JSON:
+            """
+
+_llms = {} # (model, base_url) -> ChatGroq
+_llm_lock = threading.Lock()
+_chain = None
+
+
+def get_llm(model=MODEL_NAME, base_url=None):
+    """Returns the process-wide ChatGroq client (and its HTTP connection pool) for a model, creating it once."""
+    with _llm_lock:
+        llm = _llms.get((model, base_url))
+        if llm is None:
+            import httpx
+            from dotenv import load_dotenv
+            from langchain_groq import ChatGroq
+
+            load_dotenv()
+            # Using llama-3.3-70b-versatile for complex reasoning/writing tasks
+            llm = _llms[(model, base_url)] = ChatGroq(
+            model_name=model,
+            api_key=os.getenv("GROQ_API_KEY"),
+            base_url=base_url,
+            temperature=0,
+            # Retries are left to the shared rate limiter (see Chain._invoke), which honours
+            # retry-after and paces every caller in the process, not just this request
+            max_retries=0,
+            http_client=httpx.Client(event_hooks={"response": [_learn_rate_limits]})
+            )
+        return llm
+
+
+def _learn_rate_limits(response):
+    # Every Groq response carries x-ratelimit-* headers; feed them to the shared limiter
+    get_limiter().update_from_headers(response.headers)
+
+
+@lru_cache(maxsize=None)
+def get_prompt(template):
+    """Returns the PromptTemplate for `template`, built once per process."""
+    from langchain_core.prompts import PromptTemplate
+    return PromptTemplate.from_template(template)
+
+
+def get_chain():
+    """Returns a process-wide Chain, shared by every Streamlit session and rerun."""
+    global _chain
+    with _llm_lock:
+        if _chain is None:
+            _chain = Chain()
+        return _chain
+
+
+class Chain:
+    def __init__(self, cache=None, llm=None):
+        self.model_name = MODEL_NAME
+        # The client is resolved lazily so constructing a Chain is free; by default every Chain
+        # shares the same ChatGroq instances and calls are hedged across the model pool
+        # (MAILGENIE_MODELS). An explicitly passed llm is used on its own.
+        self._llm = llm
+        self._pooled = llm is None
+        # Responses are deterministic at temperature=0, so identical requests are served from disk
+        self.cache = cache or get_cache()
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            primary = get_model_pool().primary
+            self._llm = get_llm(primary.model, primary.base_url)
+        return self._llm
+
+    @staticmethod
+    def _canonical_page(cleaned_text, stage, use_cache):
+        # A near-duplicate of a posting seen before is swapped for that posting's text, so the
+        # exact-match cache below serves its extraction/draft instead of a new LLM call
+        if not use_cache:
+            return cleaned_text
+        from dedupe import get_index
+        return get_index().canonical(cleaned_text, stage=stage)[0]
+
+    def find_duplicate(self, cleaned_text, resume_data="", fused=False):
+        """
+        Looks up a posting seen before without indexing this one, using the same trimmed text as
+        extract_and_write (fused=True) or extract_jobs. Returns None, or the match
+        ({doc_key, text, similarity}) plus `reused` (that stage will substitute the earlier
+        posting) and `cached` (its output for it is cached, so the stage needs no model call).
+        """
+        from dedupe import get_index
+        index = get_index()
+        page = trim_job_description(cleaned_text, resume_data) if fused else trim_job_description(cleaned_text)
+        match = index.query(page)
+        if match is None:
+            return None
+        match["reused"] = index.is_reusable(page, match)
+        if fused:
+            cache_keys = self._keys(FUSED_PROMPT, page_data=match["text"], resume_data=prepare_resume(resume_data, match["text"]))
+        else:
+            cache_keys = self._keys(EXTRACT_PROMPT, page_data=match["text"])
+        match["cached"] = match["reused"] and any(self.cache.contains(key) for key in cache_keys.values())
+        return match
+
+    def _keys(self, template, **inputs):
+        """
+        Cache keys for one prompt, one per model that may answer it (in pool order), so an answer
+        is only ever stored under the model that wrote it. Lookups accept any of them.
+        """
+        names = [endpoint.cache_name for endpoint in get_model_pool().endpoints] if self._pooled else [self.model_name]
+        return {name: self.cache.make_key(name, template, **inputs) for name in names}
+
+    @staticmethod
+    def _estimate_tokens(template, inputs):
+        return estimate_tokens(template) + sum(estimate_tokens(str(v)) for v in inputs.values()) + COMPLETION_TOKEN_ESTIMATE
+
+    def _invoke(self, template, inputs, stage):
+        return self._invoke_named(template, inputs, stage)[1]
+
+    def _invoke_named(self, template, inputs, stage):
+        # Runs one prompt, hedged across the model pool when a slow primary passes its latency
+        # budget; returns (name of the model that answered, result)
+        if not self._pooled:
+            return self.model_name, self._invoke_on(self.llm, template, inputs, stage)
+        endpoint, res = get_model_pool().call_with_endpoint(
+            lambda endpoint, cancel: self._invoke_on(get_llm(endpoint.model, endpoint.base_url), template, inputs, stage, cancel),
+            stage=stage
         )
-        chain_email = prompt_email | self.llm
+        return endpoint.cache_name, res
+
+    def _stream(self, template, inputs, stage, answered=None):
+        # The hedge races the wait for the first chunk; the losing stream is closed. The name of
+        # the model that won is stored in answered["model"]
+        answered = {} if answered is None else answered
+        if not self._pooled:
+            answered["model"] = self.model_name
+            yield from self._stream_on(self.llm, template, inputs, stage)
+            return
+
+        def _open(endpoint, cancel):
+            chunks = self._stream_on(get_llm(endpoint.model, endpoint.base_url), template, inputs, stage, cancel)
+            return next(chunks, None), chunks
+
+        endpoint, (first, chunks) = get_model_pool().call_with_endpoint(_open, stage=stage, discard=lambda opened: opened[1].close())
+        answered["model"] = endpoint.cache_name
+        if first is not None:
+            yield first
+            yield from chunks
+
+    def _invoke_on(self, llm, template, inputs, stage, cancel=None):
+        # Runs one prompt through one LLM, paced by the shared limiter and retried on 429s
+        from groq import RateLimitError
+
+        limiter = get_limiter()
+        estimated_tokens = self._estimate_tokens(template, inputs)
+        chain = get_prompt(template) | llm
+        for attempt in range(MAX_ATTEMPTS):
+            if cancel is not None and cancel.is_set():
+                raise Cancelled()
+            limiter.acquire(estimated_tokens)
+            try:
+                with call_slot(), metrics.span(stage):
+                    res = chain.invoke(inputs)
+            except RateLimitError as e:
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+                limiter.on_rate_limited(e.response.headers, attempt)
+                continue
+            metrics.record_message_usage(stage, res)
+            return res
+
+    def _stream_on(self, llm, template, inputs, stage, cancel=None):
+        # Streaming counterpart of _invoke_on; a 429 is only retried before the first chunk arrives
+        from groq import RateLimitError
+
+        limiter = get_limiter()
+        estimated_tokens = self._estimate_tokens(template, inputs)
+        chain = get_prompt(template) | llm
+        for attempt in range(MAX_ATTEMPTS):
+            if cancel is not None and cancel.is_set():
+                raise Cancelled()
+            limiter.acquire(estimated_tokens)
+            started = False
+            try:
+                with call_slot(), metrics.span(stage):
+                    for chunk in chain.stream(inputs):
+                        started = True
+                        # Usage arrives on the final chunk when the provider reports it for streams
+                        metrics.record_message_usage(stage, chunk)
+                        yield chunk
+                return
+            except RateLimitError as e:
+                if started or attempt == MAX_ATTEMPTS - 1:
+                    raise
+                limiter.on_rate_limited(e.response.headers, attempt)
+        
+    def _parse_structured(self, content, keys, stage, required=()):
+        """
+        Parses a structured answer, repairing it locally where possible. Only if that fails is
+        the model asked once to fix its own output. Outcomes are counted in
+        mailgenie_structured_output_total (valid / repaired / reask / failed).
+        """
+        try:
+            records, repaired = parse_records(content, keys, required)
+            metrics.increment("mailgenie_structured_output_total", stage=stage, outcome="repaired" if repaired else "valid")
+            return records
+        except ValueError as e:
+            error = e
+
+        res = self._invoke(REPAIR_PROMPT, {"output": content, "error": str(error), "keys": ", ".join(keys)}, f"{stage}_reask")
+        try:
+            records, _ = parse_records(res.content, keys, required)
+        except ValueError:
+            metrics.increment("mailgenie_structured_output_total", stage=stage, outcome="failed")
+            raise
+        metrics.increment("mailgenie_structured_output_total", stage=stage, outcome="reask")
+        return records
+
+    def extract_jobs(self, cleaned_text, use_cache=True):
+        # Long JDs are cut down to the token budget before they reach the prompt
+        cleaned_text = self._canonical_page(trim_job_description(cleaned_text), "extract_jobs", use_cache)
+        cache_keys = self._keys(EXTRACT_PROMPT, page_data=cleaned_text)
+        if use_cache:
+            cached = self.cache.get_any(cache_keys.values())
+            if cached is not None:
+                metrics.increment("mailgenie_cache_hits_total", stage="extract_jobs")
+                return cached
+
+        from langchain_core.exceptions import OutputParserException
+
+        model, res = self._invoke_named(EXTRACT_PROMPT, {"page_data": cleaned_text}, "extract_jobs")
+        try:
+            # Always a list of jobs with every key present, even if only one job is returned
+            res = self._parse_structured(res.content, JOB_KEYS, "extract_jobs")
+        except ValueError:
+            # Added more specific context to the error message
+            raise OutputParserException("Could not parse the job description into structured JSON. Try shortening the input.")
+        self.cache.set(cache_keys[model], res)
+        return res
+
+    # CORRECTED: Function signature now accepts 'resume_data' instead of 'links'
+    def write_mail(self, job, resume_data, use_cache=True):
+        # The prompt gets the compact, job-ranked resume profile instead of the raw resume
+        resume_data = prepare_resume(resume_data, str(job))
+        cache_keys = self._keys(EMAIL_PROMPT, job_description=str(job), resume_data=resume_data)
+        if use_cache:
+            cached = self.cache.get_any(cache_keys.values())
+            if cached is not None:
+                metrics.increment("mailgenie_cache_hits_total", stage="write_mail")
+                return cached
+
         # CORRECTED: Invoking the chain with the extracted job details and the raw resume text
-        res = chain_email.invoke({"job_description": str(job), "resume_data": resume_data})
+        model, res = self._invoke_named(EMAIL_PROMPT, {"job_description": str(job), "resume_data": resume_data}, "write_mail")
+        if res.content:
+            self.cache.set(cache_keys[model], res.content)
         return res.content
+
+    def extract_and_write(self, cleaned_text, resume_data, use_cache=True):
+        # Single-call alternative to extract_jobs + write_mail; returns (job, email)
+        cleaned_text = self._canonical_page(trim_job_description(cleaned_text, resume_data), "extract_and_write", use_cache)
+        resume_data = prepare_resume(resume_data, cleaned_text)
+        cache_keys = self._keys(FUSED_PROMPT, page_data=cleaned_text, resume_data=resume_data)
+        if use_cache:
+            cached = self.cache.get_any(cache_keys.values())
+            if cached is not None:
+                metrics.increment("mailgenie_cache_hits_total", stage="extract_and_write")
+                return cached["job"], cached["email"]
+
+        from langchain_core.exceptions import OutputParserException
+
+        model, res = self._invoke_named(FUSED_PROMPT, {"page_data": cleaned_text, "resume_data": resume_data}, "extract_and_write")
+        try:
+            res = self._parse_structured(res.content, FUSED_KEYS, "extract_and_write", required=("email",))[0]
+        except ValueError:
+            raise OutputParserException("Could not parse the job details and email draft from the model output. Try the detailed mode.")
+        email = res.pop("email")
+        self.cache.set(cache_keys[model], {"job": res, "email": email})
+        return res, email
+
+    def stream_mail(self, job, resume_data, use_cache=True):
+        # Same prompt as write_mail, but yields the draft chunk by chunk so the UI can render it live
+        resume_data = prepare_resume(resume_data, str(job))
+        cache_keys = self._keys(EMAIL_PROMPT, job_description=str(job), resume_data=resume_data)
+        if use_cache:
+            cached = self.cache.get_any(cache_keys.values())
+            if cached is not None:
+                metrics.increment("mailgenie_cache_hits_total", stage="write_mail")
+                yield cached
+                return
+
+        parts = []
+        answered = {}
+        for chunk in self._stream(EMAIL_PROMPT, {"job_description": str(job), "resume_data": resume_data}, "write_mail", answered):
+            if chunk.content:
+                parts.append(chunk.content)
+                yield chunk.content
+        # Only a fully consumed, non-empty stream is cached, so an abandoned draft is never stored
+        # half-written and an empty completion isn't replayed once the model recovers
+        if parts:
+            self.cache.set(cache_keys[answered["model"]], "".join(parts))
         
 
 if __name__ == "__main__":
@@ -0,0 +1,262 @@
+##Near-duplicate job posting detection with MinHash signatures and LSH banding
+import os
+import re
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+import numpy as np
+
+import metrics
+
+# The same posting shows up on several boards with small wording changes. Exact-hash caching
+# misses those, so cleaned JDs are indexed by MinHash signature. An incoming JD that is a
+# near-exact repost of one seen before is answered with the earlier text (and so its cached
+# extraction and draft) instead of new LLM calls; one that is merely similar is only flagged.
+DEFAULT_DEDUPE_PATH = os.getenv("MAILGENIE_DEDUPE_PATH", ".mailgenie_dedupe.sqlite3")
+# Estimated Jaccard similarity of word 5-gram sets above which two postings count as duplicates
+DEFAULT_THRESHOLD = float(os.getenv("MAILGENIE_DEDUPE_THRESHOLD", "0.85"))
+# A duplicate is only reused at this similarity or above, and only if no name or number changed
+# (same template, different company: "Backend Engineer at Acme" vs "... at Globex" is not reused)
+DEFAULT_REUSE_THRESHOLD = float(os.getenv("MAILGENIE_DEDUPE_REUSE_THRESHOLD", "0.95"))
+NUM_PERM = 128
+# 16 bands of 8 rows: pairs above ~0.7 similarity almost always share a bucket
+BANDS = 16
+SHINGLE_SIZE = 5
+# Upper bound on shingles hashed in one NumPy pass when signing many documents at once
+CHUNK_SHINGLES = 1 << 16
+
+MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+MAX_HASH = np.uint32((1 << 31) - 1)
+WORD_RE = re.compile(r'\w+')
+# Words that identify a posting: capitalised names (company, title, place) and anything with a digit
+DISTINCTIVE_RE = re.compile(r'\b(?:[A-Z]\w*|\w*\d\w*)\b')
+
+
+def distinctive_changes(text_a, text_b):
+    """Returns the names and numbers that appear in only one of the two texts."""
+    return set(DISTINCTIVE_RE.findall(text_a)) ^ set(DISTINCTIVE_RE.findall(text_b))
+
+
+def _permutations(num_perm, seed=1):
+    # Random (a, b) pairs for the universal hashes h(x) = (a * x + b) mod p
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, (1 << 31) - 1, size=num_perm).astype(np.uint64)
+    b = rng.randint(0, (1 << 31) - 1, size=num_perm).astype(np.uint64)
+    return a[:, None], b[:, None]
+
+
+def shingle_hashes(text, size=SHINGLE_SIZE):
+    """Returns the uint32 hashes of the word `size`-grams of `text`, combined with NumPy."""
+    words = WORD_RE.findall(text.lower())
+    if not words:
+        return np.empty(0, dtype=np.uint32)
+    word_hashes = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in words), dtype=np.uint64, count=len(words))
+    if len(words) <= size:
+        size = len(words)
+    # Polynomial rolling combination of each window of `size` word hashes, kept in 32 bits
+    count = len(words) - size + 1
+    combined = np.zeros(count, dtype=np.uint64)
+    for offset in range(size):
+        combined = (combined * np.uint64(1000003) + word_hashes[offset:offset + count]) & np.uint64(0xFFFFFFFF)
+    return np.unique(combined.astype(np.uint32))
+
+
+class NearDuplicateIndex:
+    """
+    Persistent MinHash/LSH index over cleaned job descriptions.
+
+    Signatures and band buckets live in SQLite so the index survives restarts and is shared by
+    the CLI and the app. Candidates from the LSH buckets are verified against the estimated
+    Jaccard similarity before they count as duplicates. Safe to share between threads.
+    """
+
+    def __init__(self, path=DEFAULT_DEDUPE_PATH, threshold=DEFAULT_THRESHOLD, num_perm=NUM_PERM, bands=BANDS,
+                 reuse_threshold=DEFAULT_REUSE_THRESHOLD):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.path = path
+        self.threshold = threshold
+        self.reuse_threshold = max(reuse_threshold, threshold)
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        # Setting MAILGENIE_DEDUPE_DISABLE=1 turns near-duplicate reuse off for the whole process
+        self.enabled = threshold > 0 and os.getenv("MAILGENIE_DEDUPE_DISABLE", "") not in ("1", "true", "yes")
+        self._a, self._b = _permutations(num_perm)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                doc_key TEXT NOT NULL UNIQUE,
+                text TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS buckets (
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                doc_id INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_buckets ON buckets(band, bucket);
+            """
+        )
+        self._conn.commit()
+
+    def signature(self, text):
+        """MinHash signature of one text as a (num_perm,) uint32 array."""
+        return self.signatures([text])[0]
+
+    def signatures(self, texts):
+        """
+        MinHash signatures of many texts as an (n, num_perm) uint32 array.
+
+        Shingles of several documents are hashed together in one broadcast pass and reduced per
+        document with np.minimum.reduceat, so signing tens of thousands of postings stays fast.
+        Texts without any words get an all-max signature that never matches.
+        """
+        shingles = [shingle_hashes(text) for text in texts]
+        result = np.full((len(texts), self.num_perm), MAX_HASH, dtype=np.uint32)
+        start = 0
+        while start < len(shingles):
+            # Group documents until the chunk holds about CHUNK_SHINGLES shingles
+            end, total = start, 0
+            while end < len(shingles) and (end == start or total + len(shingles[end]) <= CHUNK_SHINGLES):
+                total += len(shingles[end])
+                end += 1
+            members = [i for i in range(start, end) if len(shingles[i])]
+            if members:
+                values = np.concatenate([shingles[i] for i in members]).astype(np.uint64)
+                offsets = np.cumsum([0] + [len(shingles[i]) for i in members[:-1]])
+                hashed = (self._a * values[None, :] + self._b) % MERSENNE_PRIME
+                result[members] = np.minimum.reduceat(hashed, offsets, axis=1).T.astype(np.uint32)
+            start = end
+        return result
+
+    def _band_keys(self, signature):
+        # One 63-bit bucket id per band, hashed from that band's rows
+        keys = []
+        for band in range(self.bands):
+            rows = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            keys.append(int.from_bytes(hashlib.blake2b(rows, digest_size=8).digest(), "big") >> 1)
+        return keys
+
+    @staticmethod
+    def _is_blank(signature):
+        # Texts without words all share the all-max signature; they must never match each other
+        return not (signature < MAX_HASH).any()
+
+    @staticmethod
+    def similarity(sig_a, sig_b):
+        """Estimated Jaccard similarity of the two documents behind these signatures."""
+        return float(np.mean(sig_a == sig_b))
+
+    def _best_match(self, signature):
+        # Must be called with the lock held
+        candidates = set()
+        for band, bucket in enumerate(self._band_keys(signature)):
+            for (doc_id,) in self._conn.execute("SELECT doc_id FROM buckets WHERE band = ? AND bucket = ?", (band, bucket)):
+                candidates.add(doc_id)
+        if not candidates:
+            return None
+        placeholders = ",".join("?" * len(candidates))
+        rows = self._conn.execute(
+            f"SELECT doc_key, text, signature FROM documents WHERE id IN ({placeholders})", tuple(candidates)
+        ).fetchall()
+        stored = np.frombuffer(b"".join(row[2] for row in rows), dtype=np.uint32).reshape(len(rows), self.num_perm)
+        scores = np.mean(stored == signature[None, :], axis=1)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        return {"doc_key": rows[best][0], "text": rows[best][1], "similarity": float(scores[best])}
+
+    def query(self, text):
+        """Returns the closest indexed posting above the threshold as {doc_key, text, similarity}, or None."""
+        if not self.enabled:
+            return None
+        signature = self.signature(text)
+        if self._is_blank(signature):
+            return None
+        with self._lock:
+            return self._best_match(signature)
+
+    def _insert(self, doc_key, text, signature):
+        cursor = self._conn.execute(
+            "INSERT OR IGNORE INTO documents (doc_key, text, signature, created_at) VALUES (?, ?, ?, ?)",
+            (doc_key, text, signature.tobytes(), time.time())
+        )
+        if cursor.rowcount:
+            self._conn.executemany(
+                "INSERT INTO buckets (band, bucket, doc_id) VALUES (?, ?, ?)",
+                [(band, bucket, cursor.lastrowid) for band, bucket in enumerate(self._band_keys(signature))]
+            )
+
+    def add(self, text):
+        """Indexes one posting; returns its key. Adding the same text twice is a no-op."""
+        return self.add_many([text])[0]
+
+    def add_many(self, texts):
+        """Indexes many postings with one batched signature pass and one commit; returns their keys."""
+        texts = list(texts)
+        keys = [hashlib.sha256(text.encode("utf-8")).hexdigest() for text in texts]
+        signatures = self.signatures(texts)
+        with self._lock:
+            for key, text, signature in zip(keys, texts, signatures):
+                if not self._is_blank(signature):
+                    self._insert(key, text, signature)
+            self._conn.commit()
+        return keys
+
+    def is_reusable(self, text, match):
+        """True if `match` is close enough to `text` to answer it with the earlier posting's outputs."""
+        if match["text"] == text:
+            return True
+        return match["similarity"] >= self.reuse_threshold and not distinctive_changes(text, match["text"])
+
+    def canonical(self, text, stage=None):
+        """
+        Returns (text_to_use, match). If `text` is a near-exact repost of an indexed posting
+        (see is_reusable), that posting's text is returned so its cached LLM outputs are reused.
+        Otherwise `text` is indexed and returned unchanged; `match` is still set (with
+        reused=False) when a similar posting exists, so callers can flag it, and None if not.
+        """
+        if not self.enabled:
+            return text, None
+        signature = self.signature(text)
+        if self._is_blank(signature):
+            return text, None
+        with self._lock:
+            match = self._best_match(signature)
+            reused = match is not None and self.is_reusable(text, match)
+            if not reused:
+                self._insert(hashlib.sha256(text.encode("utf-8")).hexdigest(), text, signature)
+                self._conn.commit()
+        if match is None:
+            return text, None
+        match["reused"] = reused
+        if stage and match["text"] != text:
+            metrics.increment("mailgenie_near_duplicates_total", stage=stage, action="reused" if reused else "flagged")
+        return (match["text"] if reused else text), match
+
+    def stats(self):
+        """Returns the number of indexed postings and the active threshold."""
+        with self._lock:
+            (documents,) = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()
+        return {"documents": documents, "threshold": self.threshold, "enabled": self.enabled}
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_index():
+    """Returns the process-wide NearDuplicateIndex, opening it on first use."""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = NearDuplicateIndex()
+        return _default_index
@@ -3,48 +3,117 @@ import json
 import time
 import sys
 import os # <-- Added for environment variable access
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+
+import metrics
+from cache import get_cache
+from dedupe import get_index
+from hedging import Cancelled, get_model_pool
+from relevance import DEFAULT_MIN_SCORE, DEFAULT_TOP_K, format_score, score_jobs, select_jobs
+from ratelimit import COMPLETION_TOKEN_ESTIMATE, MAX_ATTEMPTS, acquire_call_slot, call_slot, get_limiter, release_call_slot
+from resume_profile import estimate_tokens, load_resume, prepare_resume, trim_job_description
 
 # --- Configuration ---
 # NOTE: The API key is now loaded from the environment variable GROQ_API_KEY.
 # Please ensure this environment variable is set before running the script.
 GROQ_API_KEY = os.getenv("GROQ_API_KEY") 
 MODEL_NAME = "llama-3.3-70b-versatile" # Aligning model name with chains.py
-API_URL = f"https://api.groq.com/openai/v1/chat/completions" # Using Groq API endpoint
+# GROQ_API_BASE (also read by the Groq SDK behind ChatGroq) can point at a local mock for benchmarks
+API_BASE = os.getenv("GROQ_API_BASE", "https://api.groq.com").rstrip("/")
+API_URL = f"{API_BASE}/openai/v1/chat/completions" # Using Groq API endpoint
+REQUEST_TIMEOUT = 60 # Seconds to wait for a single completion before giving up
+DEFAULT_BATCH_WORKERS = 4
+
+# A single keep-alive session is shared by every call (and every batch worker),
+# so repeated requests reuse the same TLS connection instead of reconnecting.
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session(pool_size: int = DEFAULT_BATCH_WORKERS) -> requests.Session:
+    """
+    Returns the process-wide pooled HTTP session, creating it on first use.
+
+    Args:
+        pool_size: Maximum number of keep-alive connections to hold open to the API host.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+SYSTEM_PROMPT = (
+    "You are a skilled applicant, Abhinav Prasad, applying for the target job. Your task is to write a highly tailored, "
+    "professional application email to the hiring manager. The output must start with the Subject line, followed by the email body.\n\n"
+    "Use the following rules:\n"
+    "1. The email must be written **from the perspective of Abhinav Prasad**.\n"
+    "2. The email must be concise (max 4-5 short paragraphs).\n"
+    "3. **Critically analyze** the job requirements and **directly correlate** Abhinav's skills, projects, and work experience from the resume to the job requirements. Mention specific projects or achievements where possible.\n"
+    "4. Include a compelling subject line at the very top, clearly separated (e.g., 'Subject: Inquiry about X Role').\n"
+    "5. The email should end with a professional closing and Abhinav Prasad's full contact block (Email, Phone, LinkedIn/GitHub/Portfolio links).\n"
+    "6. **MANDATORY CLOSING LINE:** You must include the following line immediately before the professional closing (e.g., 'Sincerely', 'Best regards'): 'I am available to join immediately, as I have completed all my academic coursework.'\n"
+    "7. Do not provide a preamble or post-amble, only the email content."
+)
+
+
+def build_user_query(job_description: str, resume_data: str) -> str:
+    """Builds the user message that carries the job description and resume to the model."""
+    return (
+        f"Generate the application email. Target Job Description:\n\n---\n{job_description}\n---\n\n"
+        f"Candidate Resume:\n\n---\n{resume_data}\n---"
+    )
+
+
+def prepare_job_description(job_description: str, resume_data: str, stage: str, use_cache: bool = True):
+    """
+    Fits the JD to its prompt token budget and, with the cache on, swaps a near-exact repost of a
+    JD seen before for that JD's text so its cached draft is reused (see dedupe.py).
+
+    Returns:
+        (job_description, match) where match is None or the dedupe match dict; match["reused"]
+        is False when a similar posting was only flagged, not substituted.
+    """
+    job_description = trim_job_description(job_description, resume_data)
+    if not use_cache:
+        return job_description, None
+    return get_index().canonical(job_description, stage=stage)
 
 
-def generate_application_email(job_description: str, resume_data: str) -> str:
+def generate_application_email(job_description: str, resume_data: str, session: requests.Session = None, use_cache: bool = True) -> str:
     """
     Sends job and resume data to the LLM API to generate a personalized application email.
     
     Args:
         job_description: The text content of the job posting.
         resume_data: The text content of the applicant's resume.
+        session: Optional HTTP session to send the request on. Defaults to the shared pooled session.
+        use_cache: Serve identical requests from the on-disk response cache. Pass False to force a fresh call.
 
     Returns:
         The generated email content (subject line + body) as a string, or None on failure.
     """
-    
+    job_description = prepare_job_description(job_description, resume_data, "generate_application_email", use_cache)[0]
+    return _draft_email(job_description, resume_data, session, use_cache)
+
+
+def _draft_email(job_description, resume_data, session=None, use_cache=True):
+    # generate_application_email after the JD went through prepare_job_description
     if not GROQ_API_KEY:
         print("Error: GROQ_API_KEY environment variable not set.")
         return None
 
-    system_prompt = (
-        "You are a skilled applicant, Abhinav Prasad, applying for the target job. Your task is to write a highly tailored, "
-        "professional application email to the hiring manager. The output must start with the Subject line, followed by the email body.\n\n"
-        "Use the following rules:\n"
-        "1. The email must be written **from the perspective of Abhinav Prasad**.\n"
-        "2. The email must be concise (max 4-5 short paragraphs).\n"
-        "3. **Critically analyze** the job requirements and **directly correlate** Abhinav's skills, projects, and work experience from the resume to the job requirements. Mention specific projects or achievements where possible.\n"
-        "4. Include a compelling subject line at the very top, clearly separated (e.g., 'Subject: Inquiry about X Role').\n"
-        "5. The email should end with a professional closing and Abhinav Prasad's full contact block (Email, Phone, LinkedIn/GitHub/Portfolio links).\n"
-        "6. **MANDATORY CLOSING LINE:** You must include the following line immediately before the professional closing (e.g., 'Sincerely', 'Best regards'): 'I am available to join immediately, as I have completed all my academic coursework.'\n"
-        "7. Do not provide a preamble or post-amble, only the email content."
-    )
-
-    user_query = (
-        f"Generate the application email. Target Job Description:\n\n---\n{job_description}\n---\n\n"
-        f"Candidate Resume:\n\n---\n{resume_data}\n---"
-    )
+    system_prompt = SYSTEM_PROMPT
+    # The resume block is fitted to the prompt token budget (see resume_profile.py)
+    resume_data = prepare_resume(resume_data, job_description)
+    user_query = build_user_query(job_description, resume_data)
 
     # Groq API payload (using Chat Completions format)
     payload = {
@@ -56,25 +125,89 @@ def generate_application_email(job_description: str, resume_data: str) -> str:
         "temperature": 0
     }
 
-    # API Call with Exponential Backoff
-    last_delay = 1
-    max_retries = 4
-    
+    # Identical requests are answered from the on-disk cache (temperature=0 makes them deterministic).
+    # Entries are keyed by the model that wrote them; any model of the pool may answer from cache.
+    cache = get_cache()
+    pool = get_model_pool()
+    if use_cache:
+        cached = cache.get_any([_cache_key(cache, endpoint, system_prompt, user_query) for endpoint in pool.endpoints])
+        if cached is not None:
+            metrics.increment("mailgenie_cache_hits_total", stage="generate_application_email")
+            return cached
+
     print(f"Connecting to {MODEL_NAME} API and drafting email...")
 
+    session = session or get_session()
+
+    def _attempt(endpoint, cancel):
+        # One try against one model of the pool; the pool hedges to the next model if it's slow
+        content = post_completion(session, dict(payload, model=endpoint.model), endpoint.chat_url, cancel)
+        if content is None:
+            raise RuntimeError(f"{endpoint.model} returned no completion")
+        return content
+
+    started = time.perf_counter()
+    try:
+        endpoint, email_content = pool.call_with_endpoint(_attempt, stage="generate_application_email")
+    except Exception:
+        endpoint, email_content = None, None
+    metrics.observe("generate_application_email", time.perf_counter() - started, "ok" if email_content else "error")
+
+    if email_content:
+        cache.set(_cache_key(cache, endpoint, system_prompt, user_query), email_content)
+    return email_content
+
+
+def _cache_key(cache, endpoint, system_prompt, user_query):
+    return cache.make_key(endpoint.cache_name, system_prompt, user_query=user_query)
+
+
+def estimate_payload_tokens(payload: dict) -> int:
+    """Rough token cost of a chat completion request: the prompt plus the expected completion."""
+    prompt = sum(estimate_tokens(m.get("content", "")) for m in payload.get("messages", []))
+    return prompt + payload.get("max_tokens", COMPLETION_TOKEN_ESTIMATE)
+
+
+def post_completion(session: requests.Session, payload: dict, api_url: str = API_URL, cancel=None) -> str:
+    """
+    Posts a (non-streaming) chat completion, paced by the shared rate limiter and retried with
+    jittered backoff (honouring retry-after) on 429s, and records the response's token usage.
+
+    Args:
+        session: HTTP session to send the request on.
+        payload: Chat completions request body.
+        api_url: Endpoint to post to (the model pool may route to another one).
+        cancel: Optional threading.Event; once set (another model answered first) no retry is made.
+
+    Returns:
+        The message content, or None on failure (errors are printed).
+    """
+    limiter = get_limiter()
+    estimated_tokens = estimate_payload_tokens(payload)
+    max_retries = MAX_ATTEMPTS
+
     for i in range(max_retries):
+        if cancel is not None and cancel.is_set():
+            raise Cancelled()
         try:
-            response = requests.post(
-                API_URL, 
-                headers={
-                    'Content-Type': 'application/json',
-                    'Authorization': f'Bearer {GROQ_API_KEY}' # <-- Updated to use GROQ_API_KEY
-                }, 
-                data=json.dumps(payload)
-            )
+            # Wait for request/token budget before sending instead of finding out via a 429
+            limiter.acquire(estimated_tokens)
+            with call_slot():
+                response = session.post(
+                    api_url, 
+                    headers={
+                        'Content-Type': 'application/json',
+                        'Authorization': f'Bearer {GROQ_API_KEY}' # <-- Updated to use GROQ_API_KEY
+                    }, 
+                    data=json.dumps(payload),
+                    timeout=REQUEST_TIMEOUT
+                )
+            limiter.update_from_headers(response.headers)
             response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
 
             result = response.json()
+            usage = result.get('usage') or {}
+            metrics.record_usage("generate_application_email", usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0))
             
             # Extract the raw text from the response
             email_content = result.get('choices', [{}])[0].get('message', {}).get('content')
@@ -86,14 +219,17 @@ def generate_application_email(job_description: str, resume_data: str) -> str:
 
         except requests.exceptions.HTTPError as e:
             if response.status_code == 429 and i < max_retries - 1:
-                print(f"Rate limit hit. Retrying in {last_delay} seconds...")
-                time.sleep(last_delay)
-                last_delay *= 2
+                # The limiter pauses every caller; the next acquire() waits it out
+                delay = limiter.on_rate_limited(response.headers, i)
+                print(f"Rate limit hit. Retrying in {delay:.1f} seconds...")
                 continue
             else:
                 print(f"HTTP Error: {e}")
                 print(f"Response body: {response.text}")
                 return None
+        except Cancelled:
+            # A hedge that found no free call slot; the pool keeps waiting on the other attempts
+            raise
         except Exception as e:
             print(f"An unexpected error occurred: {e}")
             return None
@@ -101,36 +237,356 @@ def generate_application_email(job_description: str, resume_data: str) -> str:
     print("Failed to call LLM API after multiple retries.")
     return None
 
+def open_completion_stream(session: requests.Session, payload: dict, api_url: str = API_URL, cancel=None):
+    """
+    Opens a streaming (`stream: true`) chat completion, retrying 429s before the first token;
+    once streaming has started we stay on it.
+
+    Returns:
+        The open requests.Response, or None on failure (errors are printed). The response holds
+        one of the process-wide call slots; release it with close_completion_stream().
+    """
+    limiter = get_limiter()
+    estimated_tokens = estimate_payload_tokens(payload)
+    max_retries = MAX_ATTEMPTS
+    for i in range(max_retries):
+        if cancel is not None and cancel.is_set():
+            raise Cancelled()
+        limiter.acquire(estimated_tokens)
+        # The slot stays held while the stream is open; close_completion_stream() frees it
+        acquire_call_slot()
+        response = None
+        try:
+            response = session.post(
+                api_url,
+                headers={
+                    'Content-Type': 'application/json',
+                    'Authorization': f'Bearer {GROQ_API_KEY}'
+                },
+                data=json.dumps(payload),
+                timeout=REQUEST_TIMEOUT,
+                stream=True
+            )
+            limiter.update_from_headers(response.headers)
+            response.raise_for_status()
+            return response
+        except requests.exceptions.HTTPError as e:
+            release_call_slot()
+            if response.status_code == 429 and i < max_retries - 1:
+                delay = limiter.on_rate_limited(response.headers, i)
+                print(f"Rate limit hit. Retrying in {delay:.1f} seconds...")
+                continue
+            print(f"HTTP Error: {e}")
+            print(f"Response body: {response.text}")
+            return None
+        except Exception as e:
+            release_call_slot()
+            print(f"An unexpected error occurred: {e}")
+            return None
+    print("Failed to call LLM API after multiple retries.")
+    return None
+
+
+def close_completion_stream(response: requests.Response):
+    """Closes a response from open_completion_stream and frees its call slot."""
+    try:
+        response.close()
+    finally:
+        release_call_slot()
+
+
+def stream_application_email(job_description: str, resume_data: str, session: requests.Session = None, use_cache: bool = True):
+    """
+    Streams the application email from the API's SSE endpoint (`stream: true`), yielding text
+    chunks as they arrive so the caller can print tokens immediately.
+
+    Args:
+        job_description: The text content of the job posting.
+        resume_data: The text content of the applicant's resume.
+        session: Optional HTTP session to send the request on. Defaults to the shared pooled session.
+        use_cache: Replay a cached draft for identical inputs (yielded as a single chunk).
+
+    Yields:
+        Pieces of the generated email. Nothing is yielded on failure; errors are printed as in
+        generate_application_email.
+    """
+    if not GROQ_API_KEY:
+        print("Error: GROQ_API_KEY environment variable not set.")
+        return
+
+    # Both blocks are fitted to the prompt token budget (see resume_profile.py)
+    job_description = prepare_job_description(job_description, resume_data, "stream_application_email", use_cache)[0]
+    resume_data = prepare_resume(resume_data, job_description)
+    user_query = build_user_query(job_description, resume_data)
+    cache = get_cache()
+    pool = get_model_pool()
+    if use_cache:
+        cached = cache.get_any([_cache_key(cache, endpoint, SYSTEM_PROMPT, user_query) for endpoint in pool.endpoints])
+        if cached is not None:
+            metrics.increment("mailgenie_cache_hits_total", stage="stream_application_email")
+            yield cached
+            return
+
+    payload = {
+        "model": MODEL_NAME,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_query}
+        ],
+        "temperature": 0,
+        "stream": True
+    }
+    session = session or get_session()
+    started = time.perf_counter()
+
+    def _attempt(endpoint, cancel):
+        response = open_completion_stream(session, dict(payload, model=endpoint.model), endpoint.chat_url, cancel)
+        if response is None:
+            raise RuntimeError(f"{endpoint.model} did not start streaming")
+        return response
+
+    # Hedging covers the wait for the response to start; a stream that lost the race is closed
+    try:
+        endpoint, response = pool.call_with_endpoint(_attempt, stage="stream_application_email", discard=close_completion_stream)
+    except Exception:
+        metrics.observe("stream_application_email", time.perf_counter() - started, "error")
+        return
+
+    parts = []
+    status = "error"
+    try:
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                # SSE frames look like `data: {...}`; blank keep-alive lines and comments are skipped
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                # Groq reports usage on the final chunk under `x_groq`; OpenAI-style servers use `usage`
+                usage = chunk.get('usage') or (chunk.get('x_groq') or {}).get('usage') or {}
+                metrics.record_usage("stream_application_email", usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0))
+                delta = (chunk.get('choices') or [{}])[0].get('delta', {}).get('content')
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        finally:
+            close_completion_stream(response)
+        status = "ok"
+    except GeneratorExit:
+        status = "cancelled"
+        raise
+    finally:
+        metrics.observe("stream_application_email", time.perf_counter() - started, status)
+
+    if parts:
+        cache.set(_cache_key(cache, endpoint, SYSTEM_PROMPT, user_query), "".join(parts))
+
+
+def load_job_descriptions(path: str):
+    """
+    Yields (item_id, job_description) pairs from a directory of text files or a JSONL file.
+
+    A directory is read file by file (sorted by name, hidden files skipped). Each JSONL line
+    must be an object with a `job_description` (or `text`) field and may carry an `id`;
+    otherwise the line number is used as the id.
+    """
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            file_path = os.path.join(path, name)
+            if name.startswith('.') or not os.path.isfile(file_path):
+                continue
+            with open(file_path, 'r') as f:
+                yield name, f.read().strip()
+        return
+
+    with open(path, 'r') as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            text = record.get('job_description') or record.get('text') or ''
+            yield str(record.get('id', line_no)), text.strip()
+
+
+def run_batch(jobs, resume_data: str, output, max_workers: int = DEFAULT_BATCH_WORKERS, use_cache: bool = True) -> dict:
+    """
+    Drafts emails for many job descriptions concurrently over one pooled HTTP session.
+
+    Each result is written to `output` as a JSON line as soon as it finishes, so a slow or
+    failed item never holds back the rest of the batch.
+
+    Args:
+        jobs: Iterable of (item_id, job_description) pairs.
+        resume_data: The text content of the applicant's resume.
+        output: Writable text stream that receives one JSON object per finished item.
+        max_workers: Maximum number of requests in flight at once.
+        use_cache: Serve previously drafted job descriptions from the response cache.
+
+    Returns:
+        A summary dict with item counts, total wall time and per-item latencies.
+    """
+    session = get_session(max_workers)
+    latencies = []
+    succeeded = failed = 0
+
+    def _draft(item_id, job_description):
+        started = time.perf_counter()
+        match = None
+        try:
+            if not job_description:
+                raise ValueError("Job description is empty.")
+            job_description, match = prepare_job_description(job_description, resume_data, "generate_application_email", use_cache)
+            email = _draft_email(job_description, resume_data, session=session, use_cache=use_cache)
+            error = None if email else "Could not generate the email draft."
+        except Exception as e:
+            email, error = None, str(e)
+        return item_id, email, error, match, time.perf_counter() - started
+
+    batch_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as pool:
+        futures = [pool.submit(_draft, item_id, jd) for item_id, jd in jobs]
+        for future in as_completed(futures):
+            item_id, email, error, match, latency = future.result()
+            latencies.append(latency)
+            if error:
+                failed += 1
+            else:
+                succeeded += 1
+            output.write(json.dumps({
+                "id": item_id,
+                "ok": error is None,
+                "email": email,
+                "error": error,
+                "latency_s": round(latency, 3),
+                # A similar posting seen before: reused=True means its draft answered this item
+                "duplicate_of": match["doc_key"] if match else None,
+                "similarity": round(match["similarity"], 3) if match else None,
+                "reused": bool(match and match["reused"]),
+            }) + "\n")
+            output.flush()
+
+    return {
+        "total": succeeded + failed,
+        "succeeded": succeeded,
+        "failed": failed,
+        "wall_time_s": round(time.perf_counter() - batch_start, 3),
+        "latencies_s": [round(l, 3) for l in latencies],
+    }
+
+
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: python email_generator.py <JOB_DESCRIPTION_FILE> <RESUME_FILE>")
-        print("Example: python email_generator.py jd.txt resume.txt")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Generate personalized application emails with the Groq API.")
+    parser.add_argument("jd", help="Job description file, or (with --batch) a directory of JD files / a JSONL file")
+    parser.add_argument("resume", help="Resume text or PDF file")
+    parser.add_argument("--batch", action="store_true", help="Draft an email for every JD in a directory or JSONL file")
+    parser.add_argument("--workers", type=int, default=DEFAULT_BATCH_WORKERS, help="Maximum concurrent requests in batch mode")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL file that batch results are streamed to")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the on-disk response cache and always call the API")
+    parser.add_argument("--no-stream", action="store_true", help="Wait for the complete draft instead of printing tokens as they arrive")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K, help="Batch mode: only draft the K JDs most relevant to the resume")
+    parser.add_argument("--min-score", type=float, default=DEFAULT_MIN_SCORE, help="Skip JDs whose local relevance score (0-1) is below this")
+    args = parser.parse_args()
+
+    jd_file_path = args.jd
+    resume_file_path = args.resume
 
-    jd_file_path = sys.argv[1]
-    resume_file_path = sys.argv[2]
-    
     try:
-        with open(jd_file_path, 'r') as f:
-            job_description = f.read().strip()
+        resume_data = load_resume(resume_file_path)
     except FileNotFoundError:
-        print(f"Error: Job description file not found at {jd_file_path}")
+        print(f"Error: Resume file not found at {resume_file_path}")
         sys.exit(1)
 
+    if args.batch:
+        if not os.path.exists(jd_file_path):
+            print(f"Error: Job description directory or JSONL file not found at {jd_file_path}")
+            sys.exit(1)
+        if not resume_data:
+            print("\nResume content must be provided. Exiting.")
+            sys.exit(1)
+
+        # Rank every JD against the resume locally and only spend LLM calls on the worthwhile ones
+        jobs = list(load_job_descriptions(jd_file_path))
+        scores = score_jobs(resume_data, [jd for _, jd in jobs])
+        selected = select_jobs(scores, top_k=args.top_k, min_score=args.min_score)
+        kept = {s["index"] for s in selected}
+        print(f"\n--- Relevance ranking ({len(kept)} of {len(jobs)} JDs selected) ---")
+        for score in sorted(scores, key=lambda s: s["score"], reverse=True):
+            print(f"{'+' if score['index'] in kept else '-'} {jobs[score['index']][0]}: {format_score(score)}")
+
+        print(f"\n--- Starting Batch Email Generation ({args.workers} workers) ---")
+        with open(args.output, 'w') as out:
+            summary = run_batch([jobs[s["index"]] for s in selected], resume_data, out, max_workers=args.workers, use_cache=not args.no_cache)
+
+        latencies = sorted(summary["latencies_s"])
+        print("\n" + "="*50)
+        print(f"Processed {summary['total']} job descriptions: {summary['succeeded']} succeeded, {summary['failed']} failed")
+        print(f"Total wall time: {summary['wall_time_s']:.2f}s")
+        if latencies:
+            print(f"Per-item latency: min {latencies[0]:.2f}s, median {latencies[len(latencies) // 2]:.2f}s, max {latencies[-1]:.2f}s")
+        cache_stats = get_cache().stats()
+        near_duplicates = {"reused": 0, "flagged": 0}
+        for counter in metrics.snapshot()["counters"]:
+            if counter["name"] == "mailgenie_near_duplicates_total":
+                near_duplicates[counter["action"]] += counter["value"]
+        print(f"Cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+              f"{near_duplicates['reused']} near-duplicate JDs reused, {near_duplicates['flagged']} flagged (duplicate_of in the output)")
+        tokens = {}
+        for counter in metrics.snapshot()["counters"]:
+            if counter["name"] == "mailgenie_tokens_total":
+                tokens[counter["kind"]] = tokens.get(counter["kind"], 0) + counter["value"]
+        print(f"Tokens: {tokens.get('prompt', 0)} prompt, {tokens.get('completion', 0)} completion")
+        if metrics.format_trim_totals():
+            print(f"Prompt blocks: {metrics.format_trim_totals()}")
+        print(f"Results written to {args.output}")
+        print("="*50)
+        sys.exit(0)
+
     try:
-        with open(resume_file_path, 'r') as f:
-            resume_data = f.read().strip()
+        with open(jd_file_path, 'r') as f:
+            job_description = f.read().strip()
     except FileNotFoundError:
-        print(f"Error: Resume file not found at {resume_file_path}")
+        print(f"Error: Job description file not found at {jd_file_path}")
         sys.exit(1)
 
     if not job_description or not resume_data:
         print("\nBoth job description and resume content must be provided. Exiting.")
         sys.exit(1)
 
+    relevance = score_jobs(resume_data, [job_description])[0]
+    print(f"\nJob description {format_score(relevance)}")
+    if relevance["score"] < args.min_score:
+        print(f"Below the minimum relevance of {args.min_score:.2f}; not drafting an email. Lower --min-score to draft anyway.")
+        sys.exit(0)
+
     print("\n--- Starting Personalized Email Generation ---")
-    
-    email_draft = generate_application_email(job_description, resume_data)
+
+    if not args.no_stream:
+        print("\n" + "="*50)
+        print("PERSONALIZED APPLICATION EMAIL DRAFT")
+        print("="*50)
+        started = time.perf_counter()
+        first_token = None
+        email_draft = ""
+        for token in stream_application_email(job_description, resume_data, use_cache=not args.no_cache):
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            email_draft += token
+            print(token, end="", flush=True)
+        total = time.perf_counter() - started
+        print("\n\n" + "="*50)
+        if email_draft:
+            print(f"Time to first token: {first_token:.2f}s | Total time: {total:.2f}s")
+            print(f"Prompt blocks: {metrics.format_trim_totals()}")
+        else:
+            print("\nCould not generate the email draft. Check the console for error details.")
+        sys.exit(0)
+
+    started = time.perf_counter()
+    email_draft = generate_application_email(job_description, resume_data, use_cache=not args.no_cache)
+    total = time.perf_counter() - started
 
     if email_draft:
         print("\n" + "="*50)
@@ -138,5 +594,7 @@ if __name__ == "__main__":
         print("="*50)
         print(email_draft)
         print("\n" + "="*50)
+        print(f"Total time: {total:.2f}s")
+        print(f"Prompt blocks: {metrics.format_trim_totals()}")
     else:
         print("\nCould not generate the email draft. Check the console for error details.")
@@ -0,0 +1,208 @@
+##Model pool with latency-based hedged requests and failover
+import os
+import time
+import queue
+import threading
+from collections import deque
+from dataclasses import dataclass
+
+import metrics
+
+# Comma-separated models in preference order; an entry may carry its own endpoint as
+# "model@https://host" (e.g. a second provider or a local mock). The first one is the primary.
+DEFAULT_MODELS = os.getenv("MAILGENIE_MODELS", "llama-3.3-70b-versatile")
+DEFAULT_API_BASE = os.getenv("GROQ_API_BASE", "https://api.groq.com").rstrip("/")
+# A hedge goes out once the current model has been silent for this percentile of its own
+# recent latencies...
+HEDGE_PERCENTILE = float(os.getenv("MAILGENIE_HEDGE_PERCENTILE", "0.95"))
+# ...or for this many seconds while there are too few samples to estimate it
+HEDGE_DEFAULT_DELAY = float(os.getenv("MAILGENIE_HEDGE_DELAY", "8"))
+# Never hedge sooner than this, so normal jitter doesn't double the request volume...
+HEDGE_MIN_DELAY = 1.0
+# ...and never later than this, or than this many times the median latency, so a heavy tail
+# can't push the delay up to the tail latency itself
+HEDGE_MAX_DELAY = float(os.getenv("MAILGENIE_HEDGE_MAX_DELAY", str(HEDGE_DEFAULT_DELAY)))
+HEDGE_MAX_MEDIAN_FACTOR = 4
+MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+
+@dataclass(frozen=True)
+class ModelEndpoint:
+    model: str
+    base_url: str = DEFAULT_API_BASE
+
+    @property
+    def chat_url(self):
+        return f"{self.base_url}/openai/v1/chat/completions"
+
+    @property
+    def cache_name(self):
+        """Model identity for response cache keys: outputs of different models never share a key."""
+        return self.model if self.base_url == DEFAULT_API_BASE else f"{self.model}@{self.base_url}"
+
+
+def parse_models(spec):
+    """Parses "model[@base_url], ..." into ModelEndpoints."""
+    endpoints = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        model, _, base_url = entry.partition("@")
+        endpoints.append(ModelEndpoint(model.strip(), (base_url.strip() or DEFAULT_API_BASE).rstrip("/")))
+    return endpoints
+
+
+class Cancelled(Exception):
+    """Raised inside a losing attempt that noticed it was cancelled."""
+
+
+_attempt_state = threading.local()
+
+
+def in_hedge():
+    """True inside a hedged (non-primary) attempt started by ModelPool.call."""
+    return getattr(_attempt_state, "hedge", False)
+
+
+class ModelPool:
+    """
+    Races an LLM call across the configured models.
+
+    The primary goes first. If it has not answered within its hedge delay (a percentile of its
+    recent latencies), the next model is tried in parallel; if an attempt fails outright, the
+    next one starts immediately. The first success wins, the others are cancelled: their
+    `cancel` event is set, and results that still arrive are handed to `discard` (e.g. to close
+    a streaming response). Per-model latencies feed both the hedge delays and the
+    mailgenie_stage_duration_seconds histogram (stage="model:<name>").
+    """
+
+    def __init__(self, endpoints=None, percentile=HEDGE_PERCENTILE, default_delay=HEDGE_DEFAULT_DELAY):
+        self.endpoints = list(endpoints or parse_models(DEFAULT_MODELS))
+        if not self.endpoints:
+            raise ValueError("The model pool needs at least one model")
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self._latencies = {endpoint: deque(maxlen=LATENCY_WINDOW) for endpoint in self.endpoints}
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self):
+        return self.endpoints[0]
+
+    def record(self, endpoint, seconds, status="ok"):
+        """Adds one observed latency for `endpoint`; only successful calls shape the hedge delay."""
+        metrics.observe(f"model:{endpoint.model}", seconds, status)
+        if status == "ok":
+            with self._lock:
+                self._latencies[endpoint].append(seconds)
+
+    def hedge_delay(self, endpoint):
+        """Seconds to wait on `endpoint` before hedging to the next model."""
+        with self._lock:
+            samples = sorted(self._latencies.get(endpoint, ()))
+        if len(samples) < MIN_SAMPLES:
+            return self.default_delay
+        index = min(len(samples) - 1, int(self.percentile * len(samples)))
+        ceiling = min(HEDGE_MAX_DELAY, HEDGE_MAX_MEDIAN_FACTOR * samples[len(samples) // 2])
+        return max(HEDGE_MIN_DELAY, min(samples[index], ceiling))
+
+    def call(self, fn, stage="llm", discard=None):
+        """
+        Runs fn(endpoint, cancel) with hedging and failover and returns the winning result.
+        `cancel` is a threading.Event the attempt should check between steps; in_hedge() tells
+        the attempt whether it is a hedge. Raises the primary's error if every model fails.
+        Use call_with_endpoint() to also learn which model answered.
+        """
+        return self.call_with_endpoint(fn, stage, discard)[1]
+
+    def call_with_endpoint(self, fn, stage="llm", discard=None):
+        """Like call(), but returns (endpoint, result) for the model that answered."""
+        if len(self.endpoints) == 1:
+            return self.primary, self._attempt(self.primary, fn, threading.Event())
+
+        results = queue.Queue()
+        cancels = {}
+
+        def _run(endpoint, cancel, hedge):
+            _attempt_state.hedge = hedge
+            try:
+                results.put((endpoint, True, self._attempt(endpoint, fn, cancel)))
+            except BaseException as e:
+                results.put((endpoint, False, e))
+
+        def _launch(endpoint):
+            cancel = threading.Event()
+            cancels[endpoint] = cancel
+            threading.Thread(target=_run, args=(endpoint, cancel, endpoint != self.primary), name=f"hedge-{endpoint.model}", daemon=True).start()
+            return time.monotonic() + self.hedge_delay(endpoint)
+
+        deadline = _launch(self.primary)
+        launched, pending, errors = 1, 1, []
+        while pending:
+            can_hedge = launched < len(self.endpoints)
+            try:
+                timeout = max(0.0, deadline - time.monotonic()) if can_hedge else None
+                endpoint, ok, value = results.get(timeout=timeout)
+            except queue.Empty:
+                metrics.increment("mailgenie_hedged_requests_total", stage=stage, reason="slow")
+                deadline = _launch(self.endpoints[launched])
+                launched += 1
+                pending += 1
+                continue
+            pending -= 1
+            if ok:
+                # Only the losers are cancelled; the winner may still hold its slot (a stream)
+                for other, cancel in cancels.items():
+                    if other != endpoint:
+                        cancel.set()
+                outcome = "primary" if endpoint == self.primary else "hedge"
+                metrics.increment("mailgenie_hedge_winner_total", stage=stage, winner=outcome)
+                if discard and pending:
+                    threading.Thread(target=self._drain, args=(results, pending, discard), daemon=True).start()
+                return endpoint, value
+            errors.append(value)
+            if can_hedge:
+                # Fail over right away instead of waiting out the hedge delay
+                metrics.increment("mailgenie_hedged_requests_total", stage=stage, reason="error")
+                deadline = _launch(self.endpoints[launched])
+                launched += 1
+                pending += 1
+        raise errors[0]
+
+    def _attempt(self, endpoint, fn, cancel):
+        started = time.perf_counter()
+        try:
+            result = fn(endpoint, cancel)
+        except Cancelled:
+            self.record(endpoint, time.perf_counter() - started, "cancelled")
+            raise
+        except BaseException:
+            self.record(endpoint, time.perf_counter() - started, "error" if not cancel.is_set() else "cancelled")
+            raise
+        # A loser that finished after the race was decided doesn't count as a normal latency:
+        # its (usually slow) time would push the hedge delay up to the tail it should cut
+        self.record(endpoint, time.perf_counter() - started, "cancelled" if cancel.is_set() else "ok")
+        return result
+
+    @staticmethod
+    def _drain(results, pending, discard):
+        # Late results from losing attempts are released instead of leaked
+        for _ in range(pending):
+            _, ok, value = results.get()
+            if ok:
+                discard(value)
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_model_pool():
+    """Returns the process-wide ModelPool built from MAILGENIE_MODELS."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ModelPool()
+        return _default_pool
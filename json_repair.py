@@ -0,0 +1,191 @@
+##Tolerant JSON extraction, local repair and schema checks for structured LLM output
+import re
+import json
+
+FENCE_RE = re.compile(r'^\s*```(?:json|JSON)?\s*|\s*```\s*$')
+SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+# Bare words the model sometimes writes in Python or JS style
+LITERALS = {"True": "true", "False": "false", "None": "null", "true": "true", "false": "false", "null": "null"}
+CLOSERS = {"{": "}", "[": "]"}
+
+
+def _find_start(text):
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    return min(starts) if starts else -1
+
+
+def _scan_value(text, start):
+    # Returns the end index (exclusive) of the bracketed value starting at `start`, or None if
+    # it never closes (e.g. the output was cut off)
+    depth, in_string, escaped = 0, False, False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    return None
+
+
+def repair(text):
+    """
+    Rewrites almost-JSON into JSON in one pass: single-quoted strings, unquoted keys, Python
+    literals, comments, trailing commas, and a value cut off mid-way (open strings and brackets
+    are closed). Text that is already valid JSON comes back unchanged.
+    """
+    out = []
+    stack = []
+    i, n = 0, len(text)
+
+    def _drop_trailing_comma():
+        while out and out[-1].isspace():
+            out.pop()
+        if out and out[-1] == ",":
+            out.pop()
+
+    while i < n:
+        ch = text[i]
+        if ch in "\"'":
+            # Copy a string, normalising the quote character to "
+            quote, i = ch, i + 1
+            out.append('"')
+            while i < n and text[i] != quote:
+                if text[i] == "\\" and i + 1 < n:
+                    # \' is not a valid JSON escape
+                    out.append("'" if text[i + 1] == "'" else text[i:i + 2])
+                    i += 2
+                    continue
+                out.append('\\"' if text[i] == '"' else text[i])
+                i += 1
+            out.append('"')
+            i += 1
+        elif text.startswith("//", i):
+            end = text.find("\n", i)
+            i = n if end == -1 else end
+        elif text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+        elif ch in "{[":
+            stack.append(ch)
+            out.append(ch)
+            i += 1
+        elif ch in "}]":
+            _drop_trailing_comma()
+            if stack:
+                stack.pop()
+            out.append(ch)
+            i += 1
+        elif ch.isalpha() or ch == "_":
+            j = i
+            while j < n and (text[j].isalnum() or text[j] in "_-"):
+                j += 1
+            word = text[i:j]
+            k = j
+            while k < n and text[k].isspace():
+                k += 1
+            if k < n and text[k] == ":":
+                out.append(f'"{word}"')
+            else:
+                out.append(LITERALS.get(word, word))
+            i = j
+        else:
+            out.append(ch)
+            i += 1
+
+    # A truncated value: close whatever is still open (a cut-off string was already closed above)
+    if stack:
+        if out and out[-1] == ":":
+            out.append('"N/A"')
+        _drop_trailing_comma()
+        out.extend(CLOSERS[opener] for opener in reversed(stack))
+    return "".join(out)
+
+
+def loads_tolerant(text):
+    """
+    Extracts the JSON value from model output that may carry code fences, prose around it,
+    several top-level objects, or small syntax errors.
+
+    Returns (value, repaired) where `repaired` is True if local fixes were needed.
+    Raises ValueError when nothing usable can be recovered.
+    """
+    if not text or not text.strip():
+        raise ValueError("The model returned an empty response.")
+    text = FENCE_RE.sub("", text.strip()).translate(SMART_QUOTES)
+    try:
+        return json.loads(text, strict=False), False
+    except json.JSONDecodeError:
+        pass
+
+    values, position = [], 0
+    while True:
+        start = _find_start(text[position:])
+        if start == -1:
+            break
+        start += position
+        end = _scan_value(text, start)
+        candidate = text[start:end]
+        try:
+            values.append(json.loads(candidate, strict=False))
+        except json.JSONDecodeError:
+            try:
+                values.append(json.loads(repair(candidate), strict=False))
+            except json.JSONDecodeError:
+                break
+        if end is None:
+            break
+        position = end
+
+    if not values:
+        raise ValueError("No JSON object found in the model output.")
+    # Prose around the value, or several objects in a row, also counts as a repair
+    return (values if len(values) > 1 else values[0]), True
+
+
+def normalize_records(value, keys, required=()):
+    """
+    Schema-checks parsed output as one or more records with `keys`. Missing or empty keys are
+    filled with "N/A" and a comma-separated `skills` string becomes a list. A wrapper such as
+    {"jobs": [...]} is unwrapped.
+
+    Returns a list of dicts. Raises ValueError if there is no record or a `required` key is empty.
+    """
+    if isinstance(value, dict):
+        wrapped = [v for v in value.values() if isinstance(v, list) and v and all(isinstance(x, dict) for x in v)]
+        if not any(key in value for key in keys) and len(wrapped) == 1:
+            value = wrapped[0]
+    records = value if isinstance(value, list) else [value]
+    records = [r for r in records if isinstance(r, dict)]
+    if not records:
+        raise ValueError("The model output holds no JSON object.")
+
+    normalized = []
+    for record in records:
+        for key in required:
+            if not record.get(key) or record.get(key) == "N/A":
+                raise ValueError(f"The model output is missing `{key}`.")
+        record = dict(record)
+        for key in keys:
+            if record.get(key) in (None, "", []):
+                record[key] = "N/A"
+        if isinstance(record.get("skills"), str) and record["skills"] != "N/A":
+            record["skills"] = [s.strip() for s in record["skills"].split(",") if s.strip()]
+        normalized.append(record)
+    return normalized
+
+
+def parse_records(text, keys, required=()):
+    """loads_tolerant + normalize_records; returns (records, repaired)."""
+    value, repaired = loads_tolerant(text)
+    return normalize_records(value, keys, required), repaired
@@ -0,0 +1,378 @@
+##Pooled SMTP sending and a background bulk outbox
+import time
+import queue
+import hashlib
+import smtplib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from email.message import EmailMessage, MIMEPart
+from typing import Optional
+
+import metrics
+
+# Conservative per-provider send rates (messages per minute) to stay clear of provider throttling
+PROVIDER_RATE_LIMITS = {
+    "smtp.gmail.com": 20,
+    "smtp.office365.com": 30,
+    "smtp-mail.outlook.com": 30,
+    "smtp.mail.yahoo.com": 20,
+}
+DEFAULT_RATE_LIMIT = 30
+# Connections idle for longer than this are probed with NOOP before reuse
+NOOP_AFTER_IDLE = 30
+# Pre-encoded attachments kept for reuse (a user normally sends one resume)
+MAX_CACHED_ATTACHMENTS = 8
+# Failures raised before the server accepted any message data: the message certainly did not go
+# out and may be sent again. Anything else (a timeout or disconnect mid-send) may have delivered it.
+NOT_SENT_ERRORS = (
+    smtplib.SMTPAuthenticationError,
+    smtplib.SMTPConnectError,
+    smtplib.SMTPHeloError,
+    smtplib.SMTPSenderRefused,
+    smtplib.SMTPRecipientsRefused,
+    smtplib.SMTPDataError,
+    smtplib.SMTPNotSupportedError,
+)
+
+
+def definitely_not_sent(error):
+    """True if `error` from SMTPSender.send means the message was not delivered."""
+    return isinstance(error, NOT_SENT_ERRORS)
+
+
+class SMTPSender:
+    """
+    Keeps one authenticated SMTP connection open and reuses it for every message.
+
+    The connection is opened lazily, probed with NOOP after sitting idle, and re-established
+    (including AUTH) if the server dropped it. Sends are serialised with a lock so a sender
+    can be shared between the UI thread and an Outbox worker.
+    """
+
+    def __init__(self, host, port, username=None, password=None, use_ssl=True, starttls=False, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.starttls = starttls
+        self.timeout = timeout
+        self._server = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self.use_ssl:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.starttls:
+                server.starttls()
+        if self.username and self.password:
+            server.login(self.username, self.password)
+        self._server = server
+
+    def _disconnect(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
+
+    def _ensure_connection(self):
+        if self._server is not None and time.monotonic() - self._last_used > NOOP_AFTER_IDLE:
+            try:
+                status, _ = self._server.noop()
+                if status != 250:
+                    self._disconnect()
+            except (smtplib.SMTPException, OSError):
+                self._server = None
+        if self._server is None:
+            self._connect()
+
+    def connect(self):
+        """Opens and authenticates the connection now, raising on bad credentials or network errors."""
+        with self._lock:
+            self._ensure_connection()
+            self._last_used = time.monotonic()
+
+    def send(self, msg: EmailMessage):
+        """
+        Sends one message over the shared connection. A dropped connection is re-established
+        before sending, but a message that failed mid-send is never re-sent automatically: the
+        server may already have accepted it. See definitely_not_sent() to classify errors.
+        """
+        with self._lock, metrics.span("smtp_send"):
+            try:
+                self._ensure_connection()
+            except (smtplib.SMTPAuthenticationError, smtplib.SMTPConnectError):
+                raise
+            except (smtplib.SMTPException, OSError) as e:
+                # Nothing was sent yet, so report it as a connection failure the caller may retry
+                self._server = None
+                raise smtplib.SMTPConnectError(-1, f"Could not connect to {self.host}:{self.port}: {e}") from e
+            try:
+                self._server.send_message(msg)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                self._server = None
+                raise
+            self._last_used = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+
+_senders = {}
+_senders_lock = threading.Lock()
+
+
+def get_sender(host, port, username, password, use_ssl=True, starttls=False):
+    """
+    Returns the process-wide sender for these credentials, so Streamlit reruns and repeat
+    sends reuse the already-authenticated connection.
+    """
+    key = (host, port, username, password, use_ssl, starttls)
+    with _senders_lock:
+        sender = _senders.get(key)
+        if sender is None:
+            sender = SMTPSender(host, port, username, password, use_ssl=use_ssl, starttls=starttls)
+            _senders[key] = sender
+        return sender
+
+
+def discard_sender(sender):
+    """Closes a sender and removes it from the registry (e.g. after an authentication failure)."""
+    with _senders_lock:
+        for key, value in list(_senders.items()):
+            if value is sender:
+                del _senders[key]
+    with _outboxes_lock:
+        _outboxes.pop(id(sender), None)
+    sender.close()
+
+
+class Attachment:
+    """
+    A file MIME-encoded once and attached to any number of messages.
+
+    EmailMessage.add_attachment base64-encodes the file again for every message; the encoded
+    part built here is shared instead, so a bulk send pays for the encoding (and the encoded
+    copy in memory) once per file rather than once per recipient.
+    """
+
+    def __init__(self, data, filename, maintype="application", subtype="pdf"):
+        self.filename = filename
+        self.size = len(data)
+        # A bare MIMEPart, not an EmailMessage: a subpart must not carry its own MIME-Version header
+        self._part = MIMEPart()
+        self._part.set_content(data, maintype=maintype, subtype=subtype, disposition="attachment", filename=filename)
+
+    def attach_to(self, msg: EmailMessage):
+        """Adds the encoded part to `msg`, turning it into multipart/mixed if needed."""
+        if msg.get_content_maintype() != "multipart" or msg.get_content_subtype() != "mixed":
+            msg.make_mixed()
+        msg.attach(self._part)
+        return msg
+
+
+_attachments = OrderedDict()
+_attachments_lock = threading.Lock()
+
+
+def get_attachment(data, filename, maintype="application", subtype="pdf"):
+    """Returns the pre-encoded Attachment for this file, encoding it on first use."""
+    key = (hashlib.sha256(data).hexdigest(), filename, maintype, subtype)
+    with _attachments_lock:
+        attachment = _attachments.get(key)
+        if attachment is not None:
+            _attachments.move_to_end(key)
+            return attachment
+    attachment = Attachment(data, filename, maintype, subtype)
+    with _attachments_lock:
+        _attachments[key] = attachment
+        while len(_attachments) > MAX_CACHED_ATTACHMENTS:
+            _attachments.popitem(last=False)
+    return attachment
+
+
+def parse_llm_output(email_content):
+    """Parses the LLM output string to separate subject and body."""
+    lines = email_content.split('\n')
+    subject = "Application Email Draft" # Default subject
+    body = email_content # Default body is the whole thing
+
+    # Look for a line starting with 'Subject:'
+    for i, line in enumerate(lines):
+        if line.lower().startswith("subject:"):
+            # Extract subject, strip 'Subject:' prefix, and clean whitespace
+            subject = line[len("subject:"):].strip()
+            # The body is everything after the subject line, joined back together
+            body = "\n".join(lines[i+1:]).strip()
+            break
+    
+    # If no specific subject line was found, ensure the first few lines aren't just empty space
+    if not subject or subject == "Application Email Draft":
+        first_line = lines[0].strip() if lines else subject
+        if first_line:
+            # Use the first non-empty line as a default subject if no "Subject:" tag was used
+            subject = first_line[:50] + "..." if len(first_line) > 50 else first_line
+            body = "\n".join(lines[1:]).strip()
+
+    return subject, body
+
+
+def build_email_message(sender_email, recipient_email, subject, body, pdf_attachment_data, pdf_filename):
+    """Builds the EmailMessage for one application, attaching the resume PDF if provided."""
+    msg = EmailMessage()
+    # Use the LLM-generated subject
+    msg['Subject'] = subject
+    msg['From'] = sender_email
+    msg['To'] = recipient_email
+    
+    # Set the body content
+    msg.set_content(body)
+
+    # NEW: Attach the PDF file if data is provided
+    if pdf_attachment_data and pdf_filename:
+        # The resume is base64-encoded once and the encoded part is shared by every message
+        get_attachment(pdf_attachment_data, pdf_filename).attach_to(msg)
+    return msg
+
+
+@dataclass
+class SendResult:
+    """Outcome of one queued message."""
+    recipient: str
+    subject: str
+    ok: bool = False
+    error: Optional[str] = None
+    # True if the failure happened before the server accepted the message, so it may be retried
+    not_sent: bool = False
+    # True if the before_send hook declined the message (or failed), so no SMTP call was made
+    skipped: bool = False
+    sent_at: Optional[float] = None
+    exception: Optional[BaseException] = field(default=None, repr=False)
+    done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    def wait(self):
+        """Blocks until the message has been attempted; re-raises its send error, if any."""
+        self.done.wait()
+        if self.exception is not None:
+            raise self.exception
+        return self
+
+
+class Outbox:
+    """
+    Queue of prepared EmailMessages drained by a background worker over one SMTPSender.
+
+    Sends are paced to the provider's rate limit, and each message gets a SendResult that
+    the UI or CLI can poll or wait on. A failed message is recorded and the queue moves on.
+    Only unfinished results are kept; finished ones live on with their callers, and the
+    outbox just counts them, so a long-lived outbox doesn't accumulate results.
+    """
+
+    def __init__(self, sender: SMTPSender, rate_per_minute=None):
+        self.sender = sender
+        self.rate_per_minute = rate_per_minute or PROVIDER_RATE_LIMITS.get(sender.host, DEFAULT_RATE_LIMIT)
+        self.sent = 0
+        self.failed = 0
+        self._pending = {}
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self._next_send = 0.0
+
+    def put(self, msg: EmailMessage, before_send=None) -> SendResult:
+        """
+        Queues a message for sending and returns its (pending) result. before_send(), if given,
+        runs on the worker right before the SMTP call (e.g. to claim the send); if it returns a
+        falsy value or raises, the message is skipped.
+        """
+        result = SendResult(recipient=str(msg['To']), subject=str(msg['Subject']))
+        with self._lock:
+            self._pending[id(result)] = result
+            self._queue.put((msg, result, before_send))
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._drain, name="mailgenie-outbox", daemon=True)
+                self._worker.start()
+        return result
+
+    def _drain(self):
+        interval = 60.0 / self.rate_per_minute
+        while True:
+            try:
+                msg, result, before_send = self._queue.get(timeout=1)
+            except queue.Empty:
+                # Exit only if nothing was queued meanwhile; put() starts a new worker next time
+                with self._lock:
+                    if self._queue.empty():
+                        self._worker = None
+                        return
+                continue
+            delay = self._next_send - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if before_send is not None and not self._before_send(before_send, result):
+                result.skipped = True
+                self._finish(result)
+                continue
+            try:
+                self.sender.send(msg)
+                result.ok = True
+                result.sent_at = time.time()
+            except Exception as e:
+                result.error = str(e)
+                result.not_sent = definitely_not_sent(e)
+                result.exception = e
+            finally:
+                self._next_send = time.monotonic() + interval
+                self._finish(result)
+
+    def _finish(self, result):
+        with self._lock:
+            self._pending.pop(id(result), None)
+            if result.ok:
+                self.sent += 1
+            elif result.error:
+                self.failed += 1
+        result.done.set()
+        self._queue.task_done()
+
+    @staticmethod
+    def _before_send(hook, result):
+        try:
+            return hook()
+        except Exception as e:
+            result.error = str(e)
+            result.exception = e
+            return False
+
+    def join(self):
+        """Blocks until every queued message has been attempted and returns summary()."""
+        self._queue.join()
+        return self.summary()
+
+    def summary(self):
+        """Returns counts of sent, failed and pending messages."""
+        with self._lock:
+            return {"sent": self.sent, "failed": self.failed, "pending": len(self._pending)}
+
+
+_outboxes = {}
+_outboxes_lock = threading.Lock()
+
+
+def get_outbox(sender):
+    """
+    Returns the process-wide Outbox for `sender`, so every send over those credentials (single
+    sends, bulk sends, every session) shares one queue and one provider rate limit.
+    """
+    with _outboxes_lock:
+        outbox = _outboxes.get(id(sender))
+        if outbox is None or outbox.sender is not sender:
+            outbox = _outboxes[id(sender)] = Outbox(sender)
+        return outbox
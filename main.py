@@ -1,15 +1,27 @@
 import os
+import copy
+import json
+import hashlib
 import streamlit as st
 import smtplib
 import time
 import socket
-from email.message import EmailMessage
 import io # NEW: Import io for file handling
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 
 # Assuming Chain and clean_text are defined in their respective files or scopes
 # Ensure you have chains.py and utils.py in the same directory
-from chains import Chain
+from chains import get_chain
 from utils import clean_text
+# parse_llm_output and build_email_message live in mailer so the campaign CLI can send without Streamlit
+from mailer import build_email_message, definitely_not_sent, discard_sender, get_outbox, get_sender, parse_llm_output
+from cache import get_cache
+from campaign import get_store, item_message, make_item_key, send_approved
+from relevance import DEFAULT_MIN_SCORE, format_score, score_jobs, select_jobs
+from resume_profile import extract_pdf_text
+from workers import get_executor, get_single_flight
+import metrics
 
 # Define the user's resume content as the default for the input area
 DEFAULT_RESUME_TEXT = """
@@ -17,94 +29,476 @@ YOUR_RESUME_HERE
 """
 
 # --- Configuration for SMTP Server ---
-SMTP_SERVER = "smtp.gmail.com" 
-SMTP_PORT = 465 # SSL port for secure connection
-
-def parse_llm_output(email_content):
-    """Parses the LLM output string to separate subject and body."""
-    lines = email_content.split('\n')
-    subject = "Application Email Draft" # Default subject
-    body = email_content # Default body is the whole thing
-
-    # Look for a line starting with 'Subject:'
-    for i, line in enumerate(lines):
-        if line.lower().startswith("subject:"):
-            # Extract subject, strip 'Subject:' prefix, and clean whitespace
-            subject = line[len("subject:"):].strip()
-            # The body is everything after the subject line, joined back together
-            body = "\n".join(lines[i+1:]).strip()
-            break
-    
-    # If no specific subject line was found, ensure the first few lines aren't just empty space
-    if not subject or subject == "Application Email Draft":
-        first_line = lines[0].strip() if lines else subject
-        if first_line:
-            # Use the first non-empty line as a default subject if no "Subject:" tag was used
-            subject = first_line[:50] + "..." if len(first_line) > 50 else first_line
-            body = "\n".join(lines[1:]).strip()
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "465")) # SSL port for secure connection
+# Set SMTP_USE_SSL=0 to talk plain SMTP, e.g. to a local aiosmtpd stand-in during testing
+SMTP_USE_SSL = os.getenv("SMTP_USE_SSL", "1") not in ("0", "false", "no")
 
-    return subject, body
+# Generation pipelines offered in the UI (see Chain.extract_and_write vs extract_jobs + write_mail)
+FUSED_MODE = "Fast (single call)"
+DETAILED_MODE = "Detailed (extract, then draft)"
+# Set MAILGENIE_METRICS_PORT to expose /metrics (Prometheus text) and /metrics.json from the app process
+METRICS_PORT = os.getenv("MAILGENIE_METRICS_PORT")
+# Upper bound on concurrent write_mail calls when drafting for every job on a careers page
+MAX_PARALLEL_DRAFTS = 4
+# Default cap on drafts when fanning out over a careers page (most relevant jobs first)
+DEFAULT_FAN_OUT_DRAFTS = 5
+# Unsent drafts restored from the campaign store after a refresh or restart
+MAX_RESTORED_DRAFTS = 20
+DEFAULT_CAMPAIGN = "default"
+# Seconds between progress refreshes while a draft is generated in the background
+POLL_INTERVAL = 0.5
+# How long the button handler waits inline before switching to polling (enough for cache hits)
+INLINE_WAIT = 0.3
 
 # UPDATED: Added pdf_attachment_data and pdf_filename arguments
 def send_generated_email(sender_email, sender_password, recipient_email, recipient_name, subject, body, pdf_attachment_data, pdf_filename):
     """
-    Connects to the SMTP server and sends the LLM-generated email with a PDF attachment.
+    Queues the LLM-generated email with a PDF attachment on the sender's outbox and returns
+    (sender, pending mailer.SendResult) without waiting. The outbox sends it over a pooled,
+    already-authenticated SMTP connection, paced with every other send to the provider's limit;
+    poll the result with poll_send() and classify it with send_outcome().
     """
     
-    msg = EmailMessage()
-    # Use the LLM-generated subject
-    msg['Subject'] = subject
-    msg['From'] = sender_email
-    msg['To'] = recipient_email
-    
-    # Set the body content
-    msg.set_content(body)
-
-    # NEW: Attach the PDF file if data is provided
-    if pdf_attachment_data and pdf_filename:
-        # Since we expect a PDF, use application/pdf subtype.
-        # Streamlit file uploader returns bytes, which is what add_attachment needs.
-        msg.add_attachment(
-            pdf_attachment_data,
-            maintype='application',
-            subtype='pdf',
-            filename=pdf_filename
-        )
+    msg = build_email_message(sender_email, recipient_email, subject, body, pdf_attachment_data, pdf_filename)
+    sender = get_sender(SMTP_SERVER, SMTP_PORT, sender_email, sender_password, use_ssl=SMTP_USE_SSL)
+    return sender, get_outbox(sender).put(msg)
+
+
+def send_outcome(sender, result, pdf_filename):
+    """
+    Classifies a finished send. Returns (outcome, notes): outcome is True if sent, False if it
+    definitely did not go out (e.g. bad credentials, refused recipient, no connection), and None
+    if it is unknown (a timeout or dropped connection after the message was handed to the
+    server), in which case it must not be retried blindly. notes are (level, text) messages.
+    """
+    e = result.exception
+    if e is None:
+        return True, [("success", f"✅ Success! Email titled '{result.subject}' sent to {result.recipient}. Resume '{pdf_filename}' attached.")]
+    if isinstance(e, smtplib.SMTPAuthenticationError):
+        # Don't keep a sender around for credentials the server rejected
+        discard_sender(sender)
+        return False, [("error", "🛑 Authentication Failed! Please check your Sender Email and App Password."),
+                       ("caption", "Hint: If using Gmail, ensure you are using a 16-character App Password.")]
+    if isinstance(e, smtplib.SMTPConnectError):
+        return False, [("error", f"🌐 Network Error! Could not connect to the server ({SMTP_SERVER}). Check your internet connection or VPN."),
+                       ("caption", f"Details: {e}")]
+    # Every SMTPException is an OSError, so the server's refusals are told apart first; only a
+    # timeout or a dropped connection mid-send leaves the outcome unknown
+    if definitely_not_sent(e):
+        return False, [("error", f"❌ The server refused the email: {e}")]
+    if isinstance(e, (smtplib.SMTPServerDisconnected, socket.timeout, ConnectionError)):
+        return None, [("error", f"🌐 Network Error while sending via {SMTP_SERVER}. The email may or may not have gone out."),
+                      ("caption", f"Details: {e}")]
+    return False, [("error", f"❌ An unexpected error occurred: {e}")]
+
 
+def make_draft(job, email_content_raw, mode, first_token, total_time, item_id=None):
+    """Builds the session-state record for one generated draft."""
+    subject, body = parse_llm_output(email_content_raw)
+    return {
+        "item_id": item_id,
+        "subject": subject,
+        "body": body,
+        "job_title": job.get('title', 'N/A'),
+        "company": job.get('company', 'N/A'),
+        "mode": mode,
+        "time_to_first_token": first_token or 0.0,
+        "total_time": total_time,
+        "sent": False
+    }
+
+
+def checkpoint_draft(campaign, item_key, source_text, cleaned_text, job, email_content_raw, draft):
+    """Persists a finished draft to the campaign store so it survives refreshes and restarts."""
+    store = get_store()
+    item_id = store.add_item(campaign, source_text, item_key=item_key)
+    store.advance(item_id, "drafted", cleaned_text=cleaned_text, job=job, email=email_content_raw,
+                  subject=draft["subject"], body=draft["body"])
+    draft["item_id"] = item_id
+    return draft
+
+
+def restore_drafts(campaign):
+    """Rebuilds the draft list from the newest unsent items of `campaign` in the store."""
+    recent = deque(get_store().iter_items(campaign, stages=("drafted", "approved")), maxlen=MAX_RESTORED_DRAFTS)
+    drafts = []
+    for item in recent:
+        job = item["job"] or {}
+        drafts.append({
+            "item_id": item["id"],
+            "subject": item["subject"] or "",
+            "body": item["body"] or "",
+            "job_title": job.get('title', 'N/A'),
+            "company": job.get('company', 'N/A'),
+            "mode": "Restored",
+            "time_to_first_token": 0.0,
+            "total_time": 0.0,
+            "sent": False
+        })
+    return drafts
+
+
+def draft_all_jobs(llm, jobs, resume_data, use_cache=True, max_workers=MAX_PARALLEL_DRAFTS):
+    """
+    Runs write_mail for every job on a bounded thread pool and yields (index, draft, error)
+    as each one finishes, so the caller can show drafts as soon as they are ready.
+    """
+    def _write(job):
+        started = time.perf_counter()
+        content = llm.write_mail(job, resume_data, use_cache=use_cache)
+        return content, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(_write, job): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                content, elapsed = future.result()
+                draft = make_draft(jobs[i], content, DETAILED_MODE, elapsed, elapsed)
+                draft["email_raw"] = content
+                yield i, draft, None
+            except Exception as e:
+                yield i, None, e
+
+
+def generation_key(request):
+    """Identifies a generation request; identical requests from any session share one job."""
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def run_generation(task, llm, request):
+    """
+    Produces the drafts for one request on a worker thread. Nothing here touches st.*: progress
+    (including each fanned-out draft as soon as it is written) goes to `task` (a workers.Job)
+    and the result, {"drafts": [...], "notes": [(level, text)]}, is picked up by
+    poll_generation() in every session waiting on it.
+    """
+    jd_input = request["jd_input"]
+    job_description_text = request["job_description_text"]
+    resume, use_cache, campaign = request["resume"], request["use_cache"], request["campaign"]
+
+    if request["mode"] == FUSED_MODE:
+        # One structured call returns both the job fields and the email draft
+        task.update(message="2/3 + 3/3: Structuring the job and drafting the email in one pass...")
+        started = time.perf_counter()
+        job, email_content_raw = llm.extract_and_write(job_description_text, resume, use_cache=use_cache)
+        total_time = time.perf_counter() - started
+        draft = make_draft(job, email_content_raw, FUSED_MODE, total_time, total_time)
+        draft = checkpoint_draft(campaign, make_item_key(jd_input), jd_input, job_description_text, job, email_content_raw, draft)
+        return {"drafts": [draft], "notes": [("success", "✅ Draft Generated! Review below and proceed to Step 2.")]}
+
+    task.update(message="2/3: Analyzing and structuring job requirements...")
+    jobs = llm.extract_jobs(job_description_text, use_cache=use_cache)
+    if not jobs:
+        return {"drafts": [], "notes": [("error", "Could not extract job details from the provided description.")]}
+
+    if request["fan_out"] and len(jobs) > 1:
+        # Rank the extracted jobs against the resume and only draft the most relevant ones
+        min_relevance = request["min_relevance"]
+        job_scores = score_jobs(resume, [str(job) for job in jobs])
+        ranked = select_jobs(job_scores, top_k=request["max_fan_out"], min_score=min_relevance)
+        if not ranked:
+            return {"drafts": [], "notes": [("warning", f"None of the {len(jobs)} jobs found reach the minimum relevance of {min_relevance:.2f}.")]}
+        chosen = [s["index"] for s in ranked]
+        notes = []
+        if len(chosen) < len(jobs):
+            notes.append(("caption", f"🎯 Drafted the {len(chosen)} most relevant of {len(jobs)} jobs found."))
+        drafts = [None] * len(jobs)
+        # Each finished draft is published on the task as soon as it lands, so waiting sessions
+        # can show it while the rest are still being written
+        ready = []
+        task.update(message=f"3/3: Drafting {len(chosen)} emails in parallel...", done=0, total=len(chosen))
+        started = time.perf_counter()
+        picked = [jobs[i] for i in chosen]
+        for done, (k, draft, error) in enumerate(draft_all_jobs(llm, picked, resume, use_cache=use_cache), start=1):
+            i = chosen[k]
+            title = f"{jobs[i].get('title', 'N/A')} at {jobs[i].get('company', 'N/A')}"
+            if error:
+                notes.append(("error", f"❌ Could not draft '{title}': {error}"))
+                ready.append({"title": title, "error": str(error)})
+            else:
+                draft["relevance"] = job_scores[i]["score"]
+                drafts[i] = checkpoint_draft(campaign, f"{make_item_key(jd_input)}-{i}", jd_input, job_description_text,
+                                             jobs[i], draft.pop("email_raw"), draft)
+                ready.append({"title": title, "relevance": draft["relevance"], "total_time": draft["total_time"],
+                              "subject": draft["subject"], "body": draft["body"]})
+            task.update(message=f"3/3: {done}/{len(chosen)} drafts ready", done=done, ready=list(ready))
+        # Most relevant first
+        drafts = [drafts[i] for i in chosen if drafts[i]]
+        notes.append(("success", f"✅ {len(drafts)} drafts generated in {time.perf_counter() - started:.1f}s! Review them below in Step 2."))
+        return {"drafts": drafts, "notes": notes}
+
+    # We usually only process the first job found; the draft streams into task.partial so
+    # waiting sessions can render it live
+    job = jobs[0]
+    task.update(message="3/3: Drafting the personalized application email...")
+    parts = []
+    first_token = None
+    started = time.perf_counter()
+    for chunk in llm.stream_mail(job, resume, use_cache=use_cache):
+        if first_token is None:
+            first_token = time.perf_counter() - started
+        parts.append(chunk)
+        task.append(chunk)
+    total_time = time.perf_counter() - started
+    email_content_raw = "".join(parts)
+    draft = make_draft(job, email_content_raw, DETAILED_MODE, first_token, total_time)
+    draft = checkpoint_draft(campaign, make_item_key(jd_input), jd_input, job_description_text, job, email_content_raw, draft)
+    return {"drafts": [draft], "notes": [("success", "✅ Draft Generated! Review below and proceed to Step 2.")]}
+
+
+def poll_generation():
+    """
+    Shows the progress of this session's background generation. Once it finishes, its drafts
+    and messages move into session state and the app reruns to show them.
+    """
+    task = st.session_state.get("generation")
+    if task is None:
+        return
+    if task.future.done():
+        st.session_state.generation = None
+        try:
+            result = task.future.result()
+        except Exception as e:
+            st.session_state.generation_notes = [("error", f"❌ An Error Occurred during generation: {e}")]
+        else:
+            if result["drafts"]:
+                # Coalesced sessions get their own copies, since drafts are edited and marked sent in place
+                st.session_state.drafts = copy.deepcopy(result["drafts"])
+                st.session_state.draft_batch += 1
+            st.session_state.generation_notes = result["notes"]
+        st.rerun()
+
+    progress = task.progress()
+    if progress["total"]:
+        st.progress(progress["done"] / progress["total"], text=progress["message"])
+    else:
+        st.info(f"⏳ {progress['message']} ({progress['elapsed']:.0f}s)")
+    for entry in progress["ready"]:
+        if entry.get("error"):
+            st.error(f"❌ Could not draft '{entry['title']}': {entry['error']}")
+            continue
+        with st.expander(f"✅ {entry['title']} · relevance {entry['relevance']:.2f} ({entry['total_time']:.1f}s)"):
+            st.markdown(f"**{entry['subject']}**")
+            st.text(entry['body'])
+    if progress["partial"]:
+        st.markdown(progress["partial"] + "▌")
+
+
+# Polls on its own timer so the rest of the page stays usable; older Streamlit versions without
+# fragments rerun the whole script instead (see the end of create_streamlit_app)
+if hasattr(st, "fragment"):
+    poll_generation = st.fragment(run_every=POLL_INTERVAL)(poll_generation)
+
+
+def send_draft(draft, sender_email, sender_password, recipient_email, recipient_name, subject, body, pdf_attachment_data, pdf_filename):
+    """
+    Approves a reviewed draft and queues it for sending at most once per recipient: the send is
+    claimed in the campaign store before any SMTP traffic, so reruns, double clicks and restarts
+    can't mail the same recruiter twice. The send runs on the outbox worker; poll_send(draft)
+    shows its progress and settles the claim once it is done.
+    """
+    store = get_store()
+    item = store.get(draft["item_id"]) if draft.get("item_id") else None
+    if item is not None:
+        store.update(item["id"], subject=subject, body=body, recipient=recipient_email, recipient_name=recipient_name)
+        store.advance(item["id"], "approved")
+        if not store.claim_send(item, recipient_email):
+            if store.send_status(item, recipient_email) == "sent":
+                st.warning(f"⚠️ This application was already sent to {recipient_email}; not sending it again.")
+            else:
+                st.warning(f"⚠️ A send to {recipient_email} was started earlier and did not confirm. Check your Sent folder before retrying.")
+            return
+    # Drafts from before the store existed (item is None) still send, just without the idempotency guard
 
     try:
-        # Check network connectivity first
-        socket.create_connection((SMTP_SERVER, SMTP_PORT), timeout=10)
-        
-        # Connect to the secure SMTP server and send the email
-        with st.spinner(f'Connecting to {SMTP_SERVER} and sending email...'):
-            with smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT) as server:
-                server.login(sender_email, sender_password)
-                server.send_message(msg)
-                st.success(f"✅ Success! Email titled '{subject}' sent to {recipient_email}. Resume '{pdf_filename}' attached.")
-                return True
-                
-    except smtplib.AuthenticationError:
-        st.error("🛑 Authentication Failed! Please check your Sender Email and App Password.")
-        st.caption("Hint: If using Gmail, ensure you are using a 16-character App Password.")
-        return False
-    except socket.error as e:
-        st.error(f"🌐 Network Error! Could not connect to the server ({SMTP_SERVER}). Check your internet connection or VPN.")
-        st.caption(f"Details: {e}")
-        return False
+        sender, result = send_generated_email(sender_email, sender_password, recipient_email, recipient_name, subject, body, pdf_attachment_data, pdf_filename)
     except Exception as e:
+        if item is not None:
+            store.release_send(item, recipient_email, error=e)
         st.error(f"❌ An unexpected error occurred: {e}")
-        return False
+        return
+    draft["pending_send"] = {"sender": sender, "result": result, "item_id": item["id"] if item else None,
+                             "recipient": recipient_email, "pdf_filename": pdf_filename}
+
+
+def poll_send(draft):
+    """Shows a queued single send until it is done, then records its outcome on the draft and in the store."""
+    pending = draft.get("pending_send")
+    if pending is None:
+        return
+    result = pending["result"]
+    if not result.done.is_set():
+        st.info(f"⏳ Sending to {pending['recipient']} via {SMTP_SERVER} (paced with your other sends)...")
+        return
+
+    draft.pop("pending_send")
+    sent, notes = send_outcome(pending["sender"], result, pending["pdf_filename"])
+    store = get_store()
+    item = store.get(pending["item_id"]) if pending["item_id"] else None
+    if sent:
+        draft["sent"] = pending["recipient"]
+        if item is not None:
+            store.complete_send(item, pending["recipient"])
+    elif sent is False:
+        # Only a send that certainly did not go out gives up its claim and may be retried
+        if item is not None:
+            store.release_send(item, pending["recipient"], error=result.error)
+    elif item is not None:
+        store.record_error(item["id"], f"send outcome unknown: {result.error}")
+        notes.append(("warning", f"⚠️ The send to {pending['recipient']} stays marked as in progress so it is not repeated. Check your Sent folder."))
+    draft["send_notes"] = notes
+    st.rerun()
+
+
+if hasattr(st, "fragment"):
+    poll_send = st.fragment(run_every=POLL_INTERVAL)(poll_send)
+
+
+def start_bulk_send(campaign, reviewed, sender_email, sender_password, pdf_attachment_data, pdf_filename):
+    """
+    Saves the reviewed fields of each draft, approves it and sends them all in the background
+    through the sender's outbox (paced to the provider's rate limit, each send claimed first so
+    it goes out at most once). Progress is kept in st.session_state.bulk_send.
+    """
+    sender = get_sender(SMTP_SERVER, SMTP_PORT, sender_email, sender_password, use_ssl=SMTP_USE_SSL)
+    try:
+        # Fail fast on bad credentials instead of failing every queued message
+        sender.connect()
+    except smtplib.SMTPAuthenticationError:
+        discard_sender(sender)
+        st.error("🛑 Authentication Failed! Please check your Sender Email and App Password.")
+        return
+    except (smtplib.SMTPException, OSError) as e:
+        st.error(f"🌐 Network Error! Could not connect to the server ({SMTP_SERVER}). Details: {e}")
+        return
+
+    store = get_store()
+    item_ids = []
+    for draft, subject, body, recipient_email, recipient_name in reviewed:
+        store.update(draft["item_id"], subject=subject, body=body, recipient=recipient_email, recipient_name=recipient_name)
+        store.advance(draft["item_id"], "approved")
+        item_ids.append(draft["item_id"])
+
+    results = []
+
+    def _record(item, result):
+        results.append({"item_id": item["id"], "recipient": result.recipient, "ok": result.ok,
+                        "not_sent": result.not_sent, "error": result.error})
+
+    build = lambda item: item_message(item, sender_email, pdf_attachment_data, pdf_filename)
+    future = get_executor().submit(send_approved, store, campaign, get_outbox(sender), build, item_ids=item_ids, on_done=_record)
+    st.session_state.bulk_send = {"future": future, "results": results, "total": len(item_ids)}
+
+
+def _result_lines(results):
+    for r in results:
+        if r["ok"]:
+            yield f"✅ Sent to {r['recipient']}"
+        elif r["not_sent"]:
+            yield f"❌ Not sent to {r['recipient']}: {r['error']} (you can retry)"
+        else:
+            yield f"⚠️ Outcome unknown for {r['recipient']}: {r['error']}. Check your Sent folder; it will not be re-sent."
+
+
+def poll_bulk_send():
+    """Shows per-message results of the running bulk send and marks sent drafts when it finishes."""
+    bulk = st.session_state.get("bulk_send")
+    if bulk is None:
+        return
+    results = list(bulk["results"])
+    sent = {r["item_id"]: r["recipient"] for r in results if r["ok"]}
+    for draft in st.session_state.drafts:
+        if draft.get("item_id") in sent:
+            draft["sent"] = sent[draft["item_id"]]
+
+    if not bulk["future"].done():
+        st.progress(len(results) / max(bulk["total"], 1), text=f"📨 Sending: {len(results)}/{bulk['total']} done (paced to the provider's rate limit)...")
+    for line in _result_lines(results):
+        st.caption(line)
+    if bulk["future"].done():
+        st.session_state.bulk_send = None
+        try:
+            counts = bulk["future"].result()
+        except Exception as e:
+            st.session_state.bulk_send_notes = [("error", f"❌ Bulk send failed: {e}")]
+        else:
+            st.session_state.bulk_send_notes = [("success", f"📨 Bulk send finished: {counts['sent']} sent, {counts['failed']} failed, "
+                                                            f"{counts['unknown']} unknown, {counts['skipped']} skipped (already sent or in flight).")]
+        st.session_state.bulk_send_notes += [("caption", line) for line in _result_lines(results)]
+        st.rerun()
+
+
+if hasattr(st, "fragment"):
+    poll_bulk_send = st.fragment(run_every=POLL_INTERVAL)(poll_bulk_send)
+
+
+def render_stats_panel():
+    """Shows per-stage latency, token spend and cache hit rate recorded in this process."""
+    snapshot = metrics.snapshot()
+    st.subheader("📊 Pipeline Stats")
+    if snapshot["stages"]:
+        st.dataframe(
+            [{
+                "Stage": s["stage"],
+                "Status": s["status"],
+                "Calls": s["count"],
+                "Mean (s)": round(s["mean_s"], 3),
+                "p95 (s)": round(s["p95_s"], 3),
+                "Max (s)": round(s["max_s"], 3),
+                "Total (s)": round(s["total_s"], 2),
+            } for s in snapshot["stages"]],
+            hide_index=True,
+            use_container_width=True
+        )
+    else:
+        st.caption("No stages recorded yet. Generate a draft first.")
+
+    tokens = [c for c in snapshot["counters"] if c["name"] == "mailgenie_tokens_total"]
+    if tokens:
+        st.markdown("**Token usage**")
+        st.dataframe(
+            [{"Stage": c["stage"], "Kind": c["kind"], "Tokens": c["value"]} for c in tokens],
+            hide_index=True,
+            use_container_width=True
+        )
+
+    # How often structured output parsed cleanly, was repaired locally, or needed a re-ask
+    outcomes = {}
+    for c in snapshot["counters"]:
+        if c["name"] == "mailgenie_structured_output_total":
+            outcomes[c["outcome"]] = outcomes.get(c["outcome"], 0) + c["value"]
+    if outcomes:
+        st.caption(f"Structured output: {outcomes.get('valid', 0)} valid · {outcomes.get('repaired', 0)} repaired locally · "
+                   f"{outcomes.get('reask', 0)} re-asked · {outcomes.get('failed', 0)} failed")
+
+    if metrics.format_trim_totals():
+        st.caption(f"Prompt blocks before → after trimming: {metrics.format_trim_totals()}")
+
+    cache_stats = get_cache().stats()
+    st.caption(f"Cache: {cache_stats['hits']} hits · {cache_stats['misses']} misses · {cache_stats['entries']} entries")
 
 
 # --- Streamlit Application UI ---
 
 def create_streamlit_app(llm, clean_text):
     
-    # Initialize session state for storing the draft
-    if 'generated_email_content' not in st.session_state:
-        st.session_state.generated_email_content = None
-    
+    # Initialize session state for storing the drafts (one per job) and the generation counter
+    # used to give each new set of drafts fresh widget keys
+    with st.sidebar:
+        # Drafts and sends are checkpointed per campaign, so a refresh picks up where it left off
+        campaign = st.text_input("Campaign", value=DEFAULT_CAMPAIGN, help="Drafts and sends are saved under this name and restored after a refresh.")
+        counts = get_store().counts(campaign)
+        st.caption(f"Campaign: {counts['drafted']} drafted · {counts['approved']} approved · {counts['sent']} sent")
+        if st.checkbox("Show pipeline stats", value=False):
+            render_stats_panel()
+
+    if 'drafts' not in st.session_state or st.session_state.get('campaign') != campaign:
+        st.session_state.drafts = restore_drafts(campaign)
+        st.session_state.draft_batch = st.session_state.get('draft_batch', 0) + 1
+        st.session_state.campaign = campaign
+
     st.title("📧 MailGenie - Personalized Application Email Automator")
     st.markdown("---")
 
@@ -124,15 +518,71 @@ def create_streamlit_app(llm, clean_text):
         )
     
     with col2:
+        # The PDF is both the attachment sent in Step 2 and, once its text is extracted, the
+        # resume the AI reads
+        pdf_file = st.file_uploader(
+            "Your Resume PDF:",
+            type=['pdf'],
+            help="Its text is extracted for the AI to read, and the file is attached to every email you send."
+        )
+        resume_text, resume_key = DEFAULT_RESUME_TEXT, "resume_text"
+        if pdf_file is not None:
+            try:
+                # Cached by content hash, so reruns and re-uploads don't parse the PDF again
+                extracted = extract_pdf_text(pdf_file.getvalue())
+            except Exception as e:
+                st.warning(f"⚠️ Could not read text from '{pdf_file.name}' ({e}). Paste your resume text below instead.")
+            else:
+                if extracted:
+                    # A new widget key per extracted text, so uploading another PDF replaces it
+                    resume_text, resume_key = extracted, "resume_text_" + hashlib.sha256(extracted.encode("utf-8")).hexdigest()[:16]
+                else:
+                    st.warning(f"⚠️ '{pdf_file.name}' has no text layer (scanned?). Paste your resume text below instead.")
+
         # Input 2: Resume Text (Defaulted to Abhinav Prasad's resume)
         # NOTE: This text area is for the LLM to read and personalize the email.
         resume_input = st.text_area(
             "Your Resume Text (for AI analysis):", 
-            height=280, 
-            value=DEFAULT_RESUME_TEXT,
-            help="The AI uses this text content to tailor the email draft to the job description. This is NOT the file attachment."
+            height=180, 
+            value=resume_text,
+            key=resume_key,
+            help="Filled from the uploaded PDF; edit it if the extraction missed anything. The AI uses this text to tailor the email draft to the job description."
         )
     
+    use_cache = st.checkbox(
+        "Reuse cached drafts for identical inputs",
+        value=True,
+        help="Untick to force a fresh call to the model even if this JD and resume were processed before."
+    )
+
+    pipeline_mode = st.radio(
+        "Pipeline mode:",
+        [FUSED_MODE, DETAILED_MODE],
+        horizontal=True,
+        help="Fast mode extracts the job details and drafts the email in one model call. Detailed mode extracts the full job breakdown first, then streams the draft."
+    )
+
+    fan_out = st.checkbox(
+        "Draft an email for every job found (detailed mode)",
+        value=False,
+        disabled=pipeline_mode != DETAILED_MODE,
+        help="For careers pages listing several openings: drafts are written in parallel, one per extracted job."
+    )
+
+    col_filter_1, col_filter_2 = st.columns(2)
+    with col_filter_1:
+        min_relevance = st.slider(
+            "Minimum relevance to draft",
+            min_value=0.0, max_value=1.0, value=DEFAULT_MIN_SCORE, step=0.01,
+            help="Local score of how much of your resume's skills the JD asks for (about 0.45 if it names each once), computed before any model call. Postings below it are skipped."
+        )
+    with col_filter_2:
+        max_fan_out = st.number_input(
+            "Draft at most this many jobs (most relevant first)",
+            min_value=1, max_value=50, value=DEFAULT_FAN_OUT_DRAFTS,
+            disabled=not fan_out or pipeline_mode != DETAILED_MODE
+        )
+
     if st.button("🚀 Generate Personalized Email Draft", type="primary", use_container_width=True):
         if not jd_input or not resume_input:
             st.error("Please provide both the Job Description and Resume text.")
@@ -143,30 +593,50 @@ def create_streamlit_app(llm, clean_text):
         try:
             with st.spinner('1/3: Cleaning and preparing job description text...'):
                 job_description_text = clean_text(jd_input)
-            
-            with st.spinner('2/3: Analyzing and structuring job requirements...'):
-                jobs = llm.extract_jobs(job_description_text)
-            
-            with st.spinner('3/3: Drafting the personalized application email...'):
-                if jobs:
-                    # We usually only process the first job found
-                    job = jobs[0]
-                    email_content_raw = llm.write_mail(job, resume_input) 
-                    
-                    subject, body = parse_llm_output(email_content_raw)
-                    
-                    st.session_state.generated_email_content = {
-                        "subject": subject, 
-                        "body": body,
-                        "job_title": job.get('title', 'N/A'),
-                        "company": job.get('company', 'N/A')
-                    }
-                    st.success(f"✅ Draft Generated! Review below and proceed to Step 2.")
-                else:
-                    st.error("Could not extract job details from the provided description.")
+
+            # Scored locally, so an irrelevant posting costs no Groq calls at all
+            relevance = score_jobs(resume_input, [job_description_text])[0]
+            st.caption(f"🎯 Job description {format_score(relevance)}")
+            if relevance["score"] < min_relevance:
+                st.warning(f"Skipped: relevance {relevance['score']:.2f} is below the minimum of {min_relevance:.2f}. Lower the slider to draft anyway.")
+                return
+
+            if use_cache:
+                # Flag reposts of a posting processed before; Chain reuses that posting's outputs
+                duplicate = llm.find_duplicate(job_description_text, resume_input, fused=pipeline_mode == FUSED_MODE)
+                if duplicate and duplicate["cached"]:
+                    reused = "extraction and draft" if pipeline_mode == FUSED_MODE else "extraction"
+                    st.info(f"♻️ This posting matches one processed before ({duplicate['similarity']:.0%} similar). Reusing its {reused} instead of calling the model again.")
+                elif duplicate and not duplicate["reused"]:
+                    st.caption(f"♻️ Similar to a posting processed before ({duplicate['similarity']:.0%}), but names or details differ, so it is drafted fresh.")
+
+            request = {
+                "jd_input": jd_input,
+                "job_description_text": job_description_text,
+                "resume": resume_input,
+                "mode": pipeline_mode,
+                "fan_out": pipeline_mode == DETAILED_MODE and fan_out,
+                "max_fan_out": int(max_fan_out),
+                "min_relevance": min_relevance,
+                "use_cache": use_cache,
+                "campaign": campaign,
+            }
+            # The model calls run on the shared worker pool; identical requests from other
+            # sessions join the job already in flight instead of calling the model again
+            task, shared = get_single_flight().submit(generation_key(request), run_generation, llm, request)
+            st.session_state.generation = task
+            if shared:
+                st.info("⏳ An identical request is already being generated; waiting for its result.")
+            # Cache hits finish almost at once, so give them a moment before showing progress
+            wait([task.future], timeout=INLINE_WAIT)
         except Exception as e:
             st.error(f"❌ An Error Occurred during generation: {e}")
 
+    for level, text in st.session_state.pop("generation_notes", []):
+        getattr(st, level)(text)
+    if st.session_state.get("generation") is not None:
+        poll_generation()
+
 
     # =========================================================================
     # STEP 2: REVIEW AND SEND
@@ -174,71 +644,111 @@ def create_streamlit_app(llm, clean_text):
     st.markdown("---")
     st.header("Step 2: Review and Send")
 
-    if st.session_state.generated_email_content:
-        draft = st.session_state.generated_email_content
-        
-        st.subheader(f"Draft for: {draft['job_title']} at {draft['company']}")
-
-        # Editable fields for subject and body
-        st.session_state.final_subject = st.text_input("Final Email Subject:", value=draft['subject'])
-        st.session_state.final_body = st.text_area("Final Email Body (Editable):", value=draft['body'], height=350)
+    if st.session_state.drafts:
+        # The resume PDF uploaded in Step 1 is attached to every email sent
+        if pdf_file is not None:
+            st.caption(f"📎 '{pdf_file.name}' will be attached to each email.")
 
-        # NEW: Resume PDF Upload
-        pdf_file = st.file_uploader(
-            "Attach Resume PDF File:", 
-            type=['pdf'],
-            help="Upload the PDF version of your resume to be attached to the email. This is mandatory for sending."
-        )
+        # Sender details are shared by every draft; each draft has its own recipient
+        st.markdown("**Sender Details**")
 
-        # Sender/Recipient Details
-        st.markdown("**Recipient & Sender Details**")
-        
         col_send_1, col_send_2 = st.columns(2)
         
         with col_send_1:
             sender_email = st.text_input("Sender Email (Your Address)", key="sender_email_input", type="default")
-            sender_password = st.text_input("App Password (16-char code)", key="sender_password_input", type="password", help="REQUIRED for Gmail. Google 'Generate App Password' for instructions.")
-        
         with col_send_2:
-            recipient_name = st.text_input("Recipient Name", value="Hiring Manager")
-            recipient_email = st.text_input("Recipient Email", value="recruiter@company.com")
+            sender_password = st.text_input("App Password (16-char code)", key="sender_password_input", type="password", help="REQUIRED for Gmail. Google 'Generate App Password' for instructions.")
+
+        batch = st.session_state.draft_batch
+        # (draft, subject, body, recipient email, recipient name) of every draft ready to send in bulk
+        reviewed = []
+        for i, draft in enumerate(st.session_state.drafts):
+            st.markdown("---")
+            st.subheader(f"Draft for: {draft['job_title']} at {draft['company']}")
+            relevance_note = f" · relevance {draft['relevance']:.2f}" if draft.get('relevance') is not None else ""
+            st.caption(f"⏱️ {draft['mode']}: first token after {draft['time_to_first_token']:.2f}s · full draft in {draft['total_time']:.2f}s{relevance_note}")
+
+            # Editable fields for subject and body
+            final_subject = st.text_input("Final Email Subject:", value=draft['subject'], key=f"subject_{batch}_{i}")
+            final_body = st.text_area("Final Email Body (Editable):", value=draft['body'], height=350, key=f"body_{batch}_{i}")
+
+            col_recipient_1, col_recipient_2 = st.columns(2)
+            with col_recipient_1:
+                recipient_name = st.text_input("Recipient Name", value="Hiring Manager", key=f"recipient_name_{batch}_{i}")
+            with col_recipient_2:
+                recipient_email = st.text_input("Recipient Email", value="recruiter@company.com", key=f"recipient_email_{batch}_{i}")
+
+            if draft['sent']:
+                st.success(f"✅ Already sent to {draft['sent']}.")
+            elif draft.get('item_id') and not draft.get('pending_send') and final_subject and final_body and recipient_email:
+                reviewed.append((draft, final_subject, final_body, recipient_email, recipient_name))
+
+            # Send Button Logic
+            if st.button("📧 SEND FINAL APPLICATION EMAIL", type="secondary", use_container_width=True, key=f"send_{batch}_{i}",
+                         disabled=draft.get('pending_send') is not None):
+                if not final_subject or not final_body:
+                    st.error("Email subject or body cannot be empty.")
+                elif not sender_email or not sender_password:
+                    st.error("Please enter your Sender Email and App Password.")
+                elif not recipient_email:
+                    st.error("Please enter the Recipient Email address.")
+                elif not pdf_file: # NEW: Check for file attachment
+                    st.error("Please upload your resume PDF in Step 1 to attach it.")
+                else:
+                    # Read the file data and filename from the uploaded object
+                    pdf_attachment_data = pdf_file.getvalue()
+                    pdf_filename = pdf_file.name
+                    
+                    send_draft(
+                        draft,
+                        sender_email, 
+                        sender_password, 
+                        recipient_email, 
+                        recipient_name,
+                        final_subject,
+                        final_body,
+                        pdf_attachment_data, # NEW: Pass data
+                        pdf_filename         # NEW: Pass filename
+                    )
+
+            for level, text in draft.pop("send_notes", []):
+                getattr(st, level)(text)
+            if draft.get("pending_send") is not None:
+                poll_send(draft)
 
         st.markdown("---")
-        
-        # Send Button Logic
-        if st.button("📧 SEND FINAL APPLICATION EMAIL", type="secondary", use_container_width=True):
-            if not st.session_state.final_subject or not st.session_state.final_body:
-                st.error("Email subject or body cannot be empty.")
-            elif not sender_email or not sender_password:
+        for level, text in st.session_state.pop("bulk_send_notes", []):
+            getattr(st, level)(text)
+        if st.session_state.get("bulk_send") is not None:
+            poll_bulk_send()
+        elif reviewed and st.button(f"📨 SEND ALL {len(reviewed)} UNSENT DRAFTS", type="primary", use_container_width=True):
+            if not sender_email or not sender_password:
                 st.error("Please enter your Sender Email and App Password.")
-            elif not recipient_email:
-                st.error("Please enter the Recipient Email address.")
-            elif not pdf_file: # NEW: Check for file attachment
-                st.error("Please upload your resume as a PDF file to attach.")
+            elif not pdf_file:
+                st.error("Please upload your resume PDF in Step 1 to attach it.")
             else:
-                # Read the file data and filename from the uploaded object
-                pdf_attachment_data = pdf_file.read()
-                pdf_filename = pdf_file.name
-                
-                send_generated_email(
-                    sender_email, 
-                    sender_password, 
-                    recipient_email, 
-                    recipient_name,
-                    st.session_state.final_subject,
-                    st.session_state.final_body,
-                    pdf_attachment_data, # NEW: Pass data
-                    pdf_filename         # NEW: Pass filename
-                )
+                start_bulk_send(campaign, reviewed, sender_email, sender_password, pdf_file.getvalue(), pdf_file.name)
+                if st.session_state.get("bulk_send") is not None:
+                    st.rerun()
 
     else:
         st.info("👈 Enter the Job Description and Resume in Step 1 and click 'Generate' to create the draft.")
 
+    polling = (st.session_state.get("generation") is not None or st.session_state.get("bulk_send") is not None
+               or any(draft.get("pending_send") is not None for draft in st.session_state.drafts))
+    if polling and not hasattr(st, "fragment"):
+        time.sleep(POLL_INTERVAL)
+        st.rerun()
+
 
 if __name__ == "__main__":
-    # Instantiate core components
+    # Streamlit re-executes this script on every interaction; get_chain() hands back the same
+    # Chain (and ChatGroq client) each time instead of rebuilding it
     # The Chain class is assumed to load the GROQ_API_KEY from the environment
-    chain = Chain()
+    chain = get_chain()
+
+    if METRICS_PORT:
+        metrics.start_metrics_server(int(METRICS_PORT))
     
     # Streamlit configuration
     st.set_page_config(layout="wide", page_title="AI Email Automator", page_icon="📧")
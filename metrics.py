@@ -0,0 +1,196 @@
+##Lightweight per-stage timing and token-usage instrumentation
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Set MAILGENIE_METRICS_LOG to a file path to also get one JSON line per span / usage record
+METRICS_LOG = os.getenv("MAILGENIE_METRICS_LOG")
+# Histogram bucket upper bounds in seconds (Prometheus-style, cumulative)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_histograms = {} # (stage, status) -> {"count", "sum", "max", "buckets"}
+_counters = {}   # (name, labels) -> value
+_server = None
+
+
+def _log(record):
+    if not METRICS_LOG:
+        return
+    record["ts"] = time.time()
+    line = json.dumps(record) + "\n"
+    with _lock:
+        with open(METRICS_LOG, "a") as f:
+            f.write(line)
+
+
+def observe(stage, seconds, status="ok"):
+    """Records one duration for a pipeline stage."""
+    with _lock:
+        hist = _histograms.get((stage, status))
+        if hist is None:
+            hist = _histograms[(stage, status)] = {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * len(BUCKETS)}
+        hist["count"] += 1
+        hist["sum"] += seconds
+        hist["max"] = max(hist["max"], seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist["buckets"][i] += 1
+    _log({"span": stage, "status": status, "duration_s": round(seconds, 6)})
+
+
+@contextmanager
+def span(stage):
+    """Times the enclosed block as `stage`; exceptions are recorded with status="error"."""
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except GeneratorExit:
+        # A streaming consumer stopped early
+        status = "cancelled"
+        raise
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        observe(stage, time.perf_counter() - started, status)
+
+
+def increment(name, value=1, **labels):
+    """Adds `value` to a counter identified by name and labels."""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def record_usage(stage, prompt_tokens=0, completion_tokens=0):
+    """Adds an LLM call's token usage to the per-stage token counters."""
+    if not prompt_tokens and not completion_tokens:
+        return
+    increment("mailgenie_tokens_total", prompt_tokens or 0, stage=stage, kind="prompt")
+    increment("mailgenie_tokens_total", completion_tokens or 0, stage=stage, kind="completion")
+    _log({"usage": stage, "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens})
+
+
+def record_trim(block, before, after):
+    """Records the token count of a prompt block (resume, job_description) before and after trimming."""
+    increment("mailgenie_prompt_block_tokens_total", before, block=block, phase="before")
+    increment("mailgenie_prompt_block_tokens_total", after, block=block, phase="after")
+    _log({"trim": block, "tokens_before": before, "tokens_after": after})
+
+
+def trim_totals():
+    """Returns {block: (tokens_before, tokens_after)} summed over every prompt built so far."""
+    totals = {}
+    for c in snapshot()["counters"]:
+        if c["name"] == "mailgenie_prompt_block_tokens_total":
+            before, after = totals.get(c["block"], (0, 0))
+            totals[c["block"]] = (before + c["value"], after) if c["phase"] == "before" else (before, after + c["value"])
+    return totals
+
+
+def format_trim_totals():
+    """One-line summary of trim_totals() for CLI output and UI captions, or "" if nothing was recorded."""
+    return " · ".join(f"{block.replace('_', ' ')} {before} → {after} tokens" for block, (before, after) in sorted(trim_totals().items()))
+
+
+def record_message_usage(stage, message):
+    """Records token usage from a LangChain message (usage_metadata or Groq's response_metadata)."""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        record_usage(stage, usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+        return
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    record_usage(stage, token_usage.get("prompt_tokens", 0), token_usage.get("completion_tokens", 0))
+
+
+def snapshot():
+    """Returns per-stage timing summaries and all counters as plain dicts (e.g. for the UI)."""
+    with _lock:
+        stages = []
+        for (stage, status), hist in sorted(_histograms.items()):
+            stages.append({
+                "stage": stage,
+                "status": status,
+                "count": hist["count"],
+                "mean_s": hist["sum"] / hist["count"],
+                "p95_s": _bucket_quantile(hist, 0.95),
+                "max_s": hist["max"],
+                "total_s": hist["sum"],
+            })
+        counters = [dict(labels, name=name, value=value) for (name, labels), value in sorted(_counters.items())]
+    return {"stages": stages, "counters": counters}
+
+
+def _bucket_quantile(hist, q):
+    # Upper bound of the first bucket holding the q-th observation (max if beyond the last bucket)
+    target = q * hist["count"]
+    for bound, count in zip(BUCKETS, hist["buckets"]):
+        if count >= target:
+            return min(bound, hist["max"])
+    return hist["max"]
+
+
+def render_prometheus():
+    """Renders all metrics in the Prometheus text exposition format."""
+    lines = [
+        "# HELP mailgenie_stage_duration_seconds Time spent in each pipeline stage.",
+        "# TYPE mailgenie_stage_duration_seconds histogram",
+    ]
+    with _lock:
+        for (stage, status), hist in sorted(_histograms.items()):
+            labels = f'stage="{stage}",status="{status}"'
+            for bound, count in zip(BUCKETS, hist["buckets"]):
+                lines.append(f'mailgenie_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'mailgenie_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {hist["count"]}')
+            lines.append(f'mailgenie_stage_duration_seconds_sum{{{labels}}} {hist["sum"]}')
+            lines.append(f'mailgenie_stage_duration_seconds_count{{{labels}}} {hist["count"]}')
+        typed = set()
+        for (name, labels), value in sorted(_counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{name}{{{label_text}}} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """Clears all recorded metrics."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/metrics.json":
+            body, content_type = json.dumps(snapshot()).encode("utf-8"), "application/json"
+        elif self.path.rstrip("/") in ("", "/metrics"):
+            body, content_type = render_prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serves /metrics (Prometheus text) and /metrics.json from a background thread, once per process."""
+    global _server
+    with _lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="mailgenie-metrics", daemon=True).start()
+        return _server
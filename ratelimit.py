@@ -0,0 +1,202 @@
+##Process-wide, header-aware rate limiter for Groq API calls
+import os
+import re
+import time
+import random
+import threading
+from contextlib import contextmanager
+
+import metrics
+from hedging import Cancelled, in_hedge
+
+# Starting budgets until the API tells us the real ones via x-ratelimit-* headers
+DEFAULT_REQUESTS_PER_MINUTE = int(os.getenv("MAILGENIE_RPM", "30"))
+DEFAULT_TOKENS_PER_MINUTE = int(os.getenv("MAILGENIE_TPM", "6000"))
+# Expected completion size, reserved from the token budget before a call goes out
+COMPLETION_TOKEN_ESTIMATE = 700
+# Attempts per call before a 429 is given up on
+MAX_ATTEMPTS = 4
+# Cap on LLM calls in flight at once across every session and thread in the process
+MAX_CONCURRENT_CALLS = int(os.getenv("MAILGENIE_MAX_CONCURRENT_CALLS", "4"))
+# Backoff used when a 429 carries no retry-after header
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 30.0
+
+DURATION_RE = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+
+
+def parse_duration(value):
+    """Parses Groq-style durations ("7.66s", "2m59.56s", "120ms") or plain seconds into seconds."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    parts = DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+
+def _header_int(headers, name):
+    value = headers.get(name)
+    try:
+        return int(float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """Classic token bucket: `capacity` units, refilled continuously at `rate` units per second."""
+
+    def __init__(self, capacity, rate):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self.level = float(capacity)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        self.refill(now)
+        # A request bigger than the whole bucket only waits for a full bucket
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate) if self.rate else 0.0
+
+    def take(self, amount):
+        self.level -= amount
+
+
+class RateLimiter:
+    """
+    Paces outgoing LLM calls against a request budget and a token budget.
+
+    Both budgets start from the defaults above and are corrected from the x-ratelimit-* headers
+    of every response, so calls slow down before the API starts returning 429. When a 429 does
+    arrive, every caller pauses for the server's retry-after (plus jitter) or a jittered
+    exponential backoff.
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60.0)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0)
+        self.blocked_until = 0.0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=0):
+        """Blocks until a request of roughly `tokens` tokens fits both budgets; returns the time waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = max(self.blocked_until - now, self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+                if wait <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(tokens)
+                    break
+            # Sleep in short steps so a budget update from another thread is picked up promptly
+            step = min(wait, 1.0)
+            time.sleep(step)
+            waited += step
+        if waited:
+            metrics.observe("rate_limit_wait", waited)
+        return waited
+
+    def update_from_headers(self, headers):
+        """Learns the current budgets from a response's x-ratelimit-* headers."""
+        if not headers:
+            return
+        limit_tokens = _header_int(headers, "x-ratelimit-limit-tokens")
+        remaining_tokens = _header_int(headers, "x-ratelimit-remaining-tokens")
+        remaining_requests = _header_int(headers, "x-ratelimit-remaining-requests")
+        reset_requests = parse_duration(headers.get("x-ratelimit-reset-requests"))
+        reset_tokens = parse_duration(headers.get("x-ratelimit-reset-tokens"))
+
+        with self._lock:
+            now = time.monotonic()
+            if limit_tokens:
+                # Groq's token limit is per minute
+                self.tokens.refill(now)
+                self.tokens.capacity = float(limit_tokens)
+                self.tokens.rate = limit_tokens / 60.0
+            if remaining_tokens is not None:
+                self.tokens.refill(now)
+                self.tokens.level = min(self.tokens.level, float(remaining_tokens))
+            if remaining_requests is not None:
+                self.requests.refill(now)
+                self.requests.level = min(self.requests.level, float(remaining_requests))
+                if remaining_requests <= 0 and reset_requests:
+                    self.blocked_until = max(self.blocked_until, now + reset_requests)
+            if remaining_tokens is not None and remaining_tokens <= 0 and reset_tokens:
+                self.blocked_until = max(self.blocked_until, now + reset_tokens)
+
+    def on_rate_limited(self, headers=None, attempt=0):
+        """
+        Records a 429 and pauses all callers. Honours retry-after when present, otherwise uses
+        full-jitter exponential backoff. Returns the pause in seconds.
+        """
+        retry_after = parse_duration((headers or {}).get("retry-after"))
+        if retry_after is not None:
+            delay = retry_after + random.uniform(0, max(0.1, retry_after * 0.2))
+        else:
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt))) + 0.1
+        with self._lock:
+            self.throttled += 1
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+        metrics.increment("mailgenie_rate_limited_total")
+        self.update_from_headers(headers)
+        return delay
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+_call_slots = threading.BoundedSemaphore(MAX_CONCURRENT_CALLS)
+
+
+def acquire_call_slot():
+    """
+    Blocks until fewer than MAX_CONCURRENT_CALLS calls are in flight; returns the time waited.
+
+    Hedged attempts count against the same cap but never queue for it: a hedge that would have
+    to wait behind the calls it is meant to bypass is pointless, so it raises Cancelled instead
+    and the race carries on with the attempts already running.
+    """
+    if _call_slots.acquire(blocking=False):
+        return 0.0
+    if in_hedge():
+        metrics.increment("mailgenie_hedges_skipped_total", reason="no_call_slot")
+        raise Cancelled("no free call slot for a hedged attempt")
+    started = time.perf_counter()
+    _call_slots.acquire()
+    waited = time.perf_counter() - started
+    metrics.observe("llm_slot_wait", waited)
+    return waited
+
+
+def release_call_slot():
+    _call_slots.release()
+
+
+@contextmanager
+def call_slot():
+    """Holds one of the process-wide LLM call slots for the enclosed block."""
+    acquire_call_slot()
+    try:
+        yield
+    finally:
+        release_call_slot()
+
+
+def get_limiter():
+    """Returns the process-wide limiter shared by Chain and email_generator."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
@@ -0,0 +1,130 @@
+##Local resume-to-JD relevance scoring (BM25) used to prefilter jobs before any LLM call
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+from resume_profile import STOPWORDS, build_profile
+
+# Skill keywords from the resume count this many times more than other resume terms
+SKILL_WEIGHT = 3.0
+# BM25 term-frequency saturation and length normalisation
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Below this many JDs the corpus is too small for meaningful IDF, so every term gets IDF 1
+MIN_IDF_CORPUS = 5
+# The 0-1 score normalises JD length against this fixed token count (roughly a cleaned posting)
+# instead of the batch average, so it doesn't move when other JDs are scored alongside
+REFERENCE_JD_LENGTH = 300
+# Optional defaults for the prefilter; unset means "keep everything"
+DEFAULT_MIN_SCORE = float(os.getenv("MAILGENIE_MIN_RELEVANCE", "0"))
+DEFAULT_TOP_K = int(os.getenv("MAILGENIE_TOP_K", "0")) or None
+
+# Matches clean_text output (alphanumerics only), so raw and cleaned text tokenise alike
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def _tokens(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def build_query(resume_text):
+    """
+    Turns a resume into weighted query terms: every resume term with weight 1, skill keywords
+    with SKILL_WEIGHT. Returns (terms, weights, skills) where skills maps each skill to its terms.
+    """
+    profile = build_profile(resume_text)
+    weights = {term: 1.0 for term in _tokens(resume_text)}
+    skills = {}
+    for skill in profile["skills"]:
+        skill_terms = _tokens(skill)
+        if skill_terms:
+            skills[skill] = skill_terms
+            for term in skill_terms:
+                weights[term] = SKILL_WEIGHT
+    terms = sorted(weights)
+    return terms, np.array([weights[t] for t in terms], dtype=np.float64), skills
+
+
+def score_jobs(resume_text, job_texts):
+    """
+    Scores every job description against the resume and returns one dict per JD, in input
+    order: {"index", "score", "bm25", "matched_skills"}.
+
+    `bm25` is classic BM25 over all resume terms, with IDF and average length taken from the
+    batch: good for ranking the batch, but not comparable across batches or resumes. `score` is
+    what thresholds apply to and only depends on this resume's skills and this JD: the skill
+    terms' saturated frequency (IDF 1, length against REFERENCE_JD_LENGTH) as a share of the
+    most they could reach. A JD naming every skill once at the reference length scores about
+    0.45; naming half of them, about 0.23. Resumes without a detected skills list fall back to
+    all their terms, which makes the score shrink as the resume grows.
+
+    Only the resume's terms are counted, so the work is one Counter per JD plus a few array
+    operations over the whole (JDs x query terms) matrix.
+    """
+    job_texts = list(job_texts)
+    terms, weights, skills = build_query(resume_text)
+    column = {term: i for i, term in enumerate(terms)}
+    tf = np.zeros((len(job_texts), len(terms)), dtype=np.float64)
+    lengths = np.zeros(len(job_texts), dtype=np.float64)
+    present = []
+    for row, text in enumerate(job_texts):
+        counts = Counter(_tokens(text))
+        lengths[row] = sum(counts.values())
+        shared = counts.keys() & column.keys()
+        present.append(shared)
+        for term in shared:
+            tf[row, column[term]] = counts[term]
+
+    if not job_texts or not terms:
+        return [{"index": i, "score": 0.0, "bm25": 0.0, "matched_skills": []} for i in range(len(job_texts))]
+
+    n = len(job_texts)
+    if n >= MIN_IDF_CORPUS:
+        df = np.count_nonzero(tf, axis=0)
+        idf = np.log1p((n - df + 0.5) / (df + 0.5))
+    else:
+        idf = np.ones(len(terms))
+    avg_length = lengths.mean() or 1.0
+    bm25 = _saturate(tf, lengths, avg_length) @ (idf * weights)
+
+    # The stable score: skill terms only, no IDF, fixed reference length
+    skill_columns = sorted({column[t] for skill_terms in skills.values() for t in skill_terms})
+    query = np.array(skill_columns, dtype=np.intp) if skill_columns else np.arange(len(terms))
+    saturated = _saturate(tf[:, query], lengths, REFERENCE_JD_LENGTH)
+    normalised = saturated.mean(axis=1) / (BM25_K1 + 1)
+
+    results = []
+    for row in range(n):
+        matched = [skill for skill, skill_terms in skills.items() if all(t in present[row] for t in skill_terms)]
+        results.append({
+            "index": row,
+            "score": float(normalised[row]),
+            "bm25": float(bm25[row]),
+            "matched_skills": matched,
+        })
+    return results
+
+
+def _saturate(tf, lengths, reference_length):
+    # BM25's term-frequency saturation with length normalisation against `reference_length`
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / reference_length)
+    return tf * (BM25_K1 + 1) / (tf + norm[:, None])
+
+
+def select_jobs(scores, top_k=DEFAULT_TOP_K, min_score=DEFAULT_MIN_SCORE):
+    """
+    Returns the scored JDs worth spending LLM calls on, best first: those at or above
+    `min_score`, capped at `top_k` (None keeps all).
+    """
+    ranked = sorted(scores, key=lambda s: (s["score"], s["bm25"]), reverse=True)
+    ranked = [s for s in ranked if s["score"] >= (min_score or 0)]
+    return ranked[:top_k] if top_k else ranked
+
+
+def format_score(score):
+    """One-line summary of a score for CLI output and UI captions."""
+    skills = ", ".join(score["matched_skills"][:5]) or "none"
+    more = f" +{len(score['matched_skills']) - 5}" if len(score["matched_skills"]) > 5 else ""
+    return f"relevance {score['score']:.2f} (BM25 {score['bm25']:.1f}; skills matched: {skills}{more})"
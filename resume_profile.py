@@ -0,0 +1,306 @@
+##Resume profile precomputation and prompt token budgeting
+import io
+import os
+import re
+import math
+import hashlib
+import threading
+
+import metrics
+from cache import get_cache
+
+_encoding = None
+_encoding_loaded = False
+
+# Token ceilings for the resume and job description blocks of a prompt (0 disables trimming)
+RESUME_TOKEN_BUDGET = int(os.getenv("MAILGENIE_RESUME_TOKEN_BUDGET", "700"))
+JD_TOKEN_BUDGET = int(os.getenv("MAILGENIE_JD_TOKEN_BUDGET", "1200"))
+# Bump when the profile format changes so stale cached profiles are ignored
+PROFILE_VERSION = "1"
+# Bump when PDF text extraction changes so stale cached text is ignored
+PDF_TEXT_VERSION = "1"
+# Cleaned JDs have no punctuation left, so they are trimmed in fixed-size word windows
+JD_WINDOW_WORDS = 60
+
+SECTION_KEYWORDS = (
+    "summary", "objective", "skills", "technical skills", "projects", "experience",
+    "work experience", "education", "certifications", "achievements", "publications",
+    "internships", "leadership", "awards", "languages", "interests",
+)
+STOPWORDS = {
+    "the", "and", "for", "with", "you", "our", "are", "will", "from", "that", "this", "have",
+    "has", "your", "who", "all", "can", "their", "they", "not", "but", "any", "into", "able",
+    "work", "team", "job", "role", "years", "year", "strong", "good", "including", "such",
+}
+
+EMAIL_RE = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+# Optional +country code, then 2-5 digit groups (an area code may be in parentheses);
+# _is_phone() then requires 10-15 digits so date ranges like "2019 - 2023" never match
+PHONE_RE = re.compile(r'(?<![\w+])(?:\+\d{1,3}[\s.-]?)?(?:\(\d{2,5}\)[\s.-]?)?\d{2,5}(?:[\s.-]?\d{2,5}){1,4}(?!\w)')
+YEAR_RE = re.compile(r'(?:19|20)\d\d')
+LINK_RE = re.compile(r'(?:https?://|www\.)\S+|(?:linkedin|github)\.com/\S+', re.IGNORECASE)
+WORD_RE = re.compile(r'[a-z0-9+#]+')
+
+_profiles = {}
+_pdf_texts = {}
+_profiles_lock = threading.Lock()
+
+
+def _get_encoding():
+    # Loading the tokenizer is slow, so it happens on first use rather than at import
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        try:
+            # tiktoken is optional; cl100k is close enough to Llama's tokenizer for budgeting purposes
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except ImportError:
+            _encoding = None
+        _encoding_loaded = True
+    return _encoding
+
+
+def estimate_tokens(text):
+    """Returns the token count of `text` (approximate if tiktoken is not installed)."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def _terms(text):
+    return {w for w in WORD_RE.findall(text.lower()) if len(w) > 1 and w not in STOPWORDS}
+
+
+def _is_heading(line):
+    stripped = line.strip().strip('#').strip().rstrip(':').strip()
+    if not stripped or len(stripped) > 40:
+        return False
+    if stripped.lower() in SECTION_KEYWORDS:
+        return True
+    return line.strip().startswith('#') or (stripped.isupper() and any(c.isalpha() for c in stripped))
+
+
+def build_profile(resume_text):
+    """
+    Parses a resume into a compact profile: the contact block, the skill keywords and the
+    resume's sections. Profiles are cached in memory and on disk keyed by the content hash,
+    so an unchanged resume is only parsed once.
+    """
+    digest = hashlib.sha256(resume_text.encode("utf-8")).hexdigest()
+    with _profiles_lock:
+        if digest in _profiles:
+            return _profiles[digest]
+
+    cache = get_cache()
+    cache_key = cache.make_key("resume-profile", PROFILE_VERSION, resume_sha256=digest)
+    profile = cache.get(cache_key)
+    if profile is None:
+        profile = _parse_resume(resume_text)
+        profile["sha256"] = digest
+        cache.set(cache_key, profile)
+
+    with _profiles_lock:
+        _profiles[digest] = profile
+    return profile
+
+
+def extract_pdf_text(pdf_bytes):
+    """
+    Extracts the text of a PDF resume. Like profiles, the text is cached in memory and on disk
+    keyed by the file's content hash, so re-uploads and reruns don't parse the PDF again.
+    """
+    digest = hashlib.sha256(pdf_bytes).hexdigest()
+    with _profiles_lock:
+        if digest in _pdf_texts:
+            return _pdf_texts[digest]
+
+    cache = get_cache()
+    cache_key = cache.make_key("resume-pdf-text", PDF_TEXT_VERSION, pdf_sha256=digest)
+    text = cache.get(cache_key)
+    if text is None:
+        text = _read_pdf(pdf_bytes)
+        cache.set(cache_key, text)
+
+    with _profiles_lock:
+        _pdf_texts[digest] = text
+    return text
+
+
+def _read_pdf(pdf_bytes):
+    # pypdf is only needed for PDF resumes, so it is imported on first use
+    from pypdf import PdfReader
+
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    lines = []
+    for page in reader.pages:
+        for line in (page.extract_text() or "").splitlines():
+            # Keep the line structure (section headings are detected per line) but drop layout padding
+            line = re.sub(r'[ \t]+', ' ', line).strip()
+            if line:
+                lines.append(line)
+    return "\n".join(lines)
+
+
+def load_resume(path):
+    """Reads a resume from a text file, or extracts it from a PDF."""
+    if path.lower().endswith(".pdf"):
+        with open(path, "rb") as f:
+            return extract_pdf_text(f.read())
+    with open(path, "r") as f:
+        return f.read().strip()
+
+
+def _is_phone(candidate):
+    digits = re.sub(r'\D', '', candidate)
+    if not 10 <= len(digits) <= 15:
+        return False
+    # "2018 2019 2020" or "2019-2023 2024" are years, not a phone number
+    return not all(YEAR_RE.fullmatch(group) for group in re.findall(r'\d+', candidate))
+
+
+def _parse_resume(resume_text):
+    lines = [line.rstrip() for line in resume_text.strip().splitlines()]
+    header, sections, current = [], [], None
+    for line in lines:
+        if _is_heading(line):
+            current = {"title": line.strip().strip('#').strip().rstrip(':'), "lines": []}
+            sections.append(current)
+        elif current is None:
+            header.append(line)
+        elif line.strip():
+            current["lines"].append(line)
+
+    # The contact block is the name/header lines plus any contact details found anywhere
+    contact = [line.strip() for line in header if line.strip()][:6]
+    phones = [p for p in PHONE_RE.findall(resume_text) if _is_phone(p)]
+    found = EMAIL_RE.findall(resume_text) + phones + LINK_RE.findall(resume_text)
+    for item in found:
+        item = item.strip()
+        if item and not any(item in line for line in contact):
+            contact.append(item)
+
+    skills = []
+    for section in sections:
+        if "skill" in section["title"].lower():
+            for line in section["lines"]:
+                line = line.split(':', 1)[-1]
+                skills.extend(s.strip(' •-*\t') for s in re.split(r'[,|;•]', line) if s.strip(' •-*\t'))
+
+    return {
+        "contact": "\n".join(contact),
+        "skills": skills,
+        "sections": [{"title": s["title"], "text": "\n".join(s["lines"])} for s in sections if s["lines"]],
+    }
+
+
+def _truncate(text, budget):
+    # Cuts `text` to at most `budget` tokens, on a token boundary when tiktoken is available
+    if budget <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text)[:budget]).rstrip()
+    return text[:budget * 4].rstrip()
+
+
+def _fit(text, budget):
+    # Keeps whole lines of `text` until the token budget runs out; the line that no longer fits is
+    # cut at the token boundary rather than dropped, so non-empty text never comes back empty
+    kept, used = [], 0
+    for line in text.splitlines():
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            partial = _truncate(line, budget - used - 1) if line.strip() else ""
+            if partial:
+                kept.append(partial)
+            break
+        kept.append(line)
+        used += cost
+    if not any(line.strip() for line in kept) and text.strip():
+        return _truncate(text.strip(), max(budget, 1))
+    return "\n".join(kept)
+
+
+def prepare_resume(resume_text, job_text="", max_tokens=None):
+    """
+    Renders the cached resume profile for a prompt: contact block first, then sections ordered
+    by how many of the job's terms they mention, trimmed to `max_tokens`.
+    """
+    max_tokens = RESUME_TOKEN_BUDGET if max_tokens is None else max_tokens
+    before = estimate_tokens(resume_text)
+    profile = build_profile(resume_text)
+
+    if not profile["sections"]:
+        # Nothing to rank (no recognisable headings), so fall back to a plain line-wise trim
+        if not max_tokens or before <= max_tokens:
+            metrics.record_trim("resume", before, before)
+            return resume_text
+        rendered = _fit(resume_text, max_tokens)
+    else:
+        job_terms = _terms(job_text)
+
+        def relevance(section):
+            section_terms = _terms(section["title"] + " " + section["text"])
+            return len(job_terms & section_terms) / math.sqrt(len(section_terms) or 1)
+
+        parts = [profile["contact"]] if profile["contact"] else []
+        remaining = (max_tokens or math.inf) - estimate_tokens(profile["contact"])
+        for section in sorted(profile["sections"], key=relevance, reverse=True):
+            if remaining <= 0:
+                break
+            block = f"{section['title'].upper()}:\n{section['text']}"
+            cost = estimate_tokens(block)
+            if cost > remaining:
+                block = _fit(block, remaining)
+                cost = estimate_tokens(block)
+            if "\n" in block:
+                parts.append(block)
+                remaining -= cost
+        rendered = "\n\n".join(parts)
+
+    metrics.record_trim("resume", before, estimate_tokens(rendered))
+    return rendered
+
+
+def trim_job_description(job_text, resume_text="", max_tokens=None):
+    """
+    Trims a (cleaned) job description to `max_tokens`, keeping the word windows that share the
+    most terms with the resume's skills and the usual requirement keywords, in original order.
+    A window that no longer fits whole is cut to the remaining budget rather than dropped, so
+    non-empty text never comes back empty.
+    """
+    max_tokens = JD_TOKEN_BUDGET if max_tokens is None else max_tokens
+    before = estimate_tokens(job_text)
+    if not max_tokens or before <= max_tokens:
+        metrics.record_trim("job_description", before, before)
+        return job_text
+
+    focus = {"requirements", "required", "qualifications", "responsibilities", "skills", "experience", "preferred"}
+    if resume_text:
+        focus |= _terms(" ".join(build_profile(resume_text)["skills"]))
+
+    words = job_text.split()
+    windows = [words[i:i + JD_WINDOW_WORDS] for i in range(0, len(words), JD_WINDOW_WORDS)]
+    # The opening window usually carries the title and company, so it always ranks first
+    scores = [math.inf] + [len(focus & _terms(" ".join(w))) for w in windows[1:]]
+    keep, used = {}, 0
+    for index in sorted(range(len(windows)), key=lambda i: scores[i], reverse=True):
+        text = " ".join(windows[index])
+        cost = estimate_tokens(text)
+        if used + cost > max_tokens:
+            # Cut the window (e.g. the opening one, or a JD that is a single huge token) to fit
+            text = _truncate(text, max_tokens - used)
+            if not text:
+                continue
+            cost = estimate_tokens(text)
+        keep[index] = text
+        used += cost
+
+    trimmed = " ".join(keep[i] for i in sorted(keep))
+    if not trimmed and job_text.strip():
+        trimmed = _truncate(job_text.strip(), max(max_tokens, 1)) or job_text.strip()[:4]
+    metrics.record_trim("job_description", before, estimate_tokens(trimmed))
+    return trimmed
@@ -1,15 +1,138 @@
 ##Cleaning the web pages
 import re
 
+import metrics
+
+# Patterns are compiled once at import instead of on every call
+# Whole script/style/nav blocks are dropped, not just their tags
+BLOCK_OPEN_RE = re.compile(r'<(script|style|noscript|nav)\b[^>]*>', re.IGNORECASE)
+BLOCK_CLOSE_RES = {
+    name: re.compile(r'</%s\s*>' % name, re.IGNORECASE) for name in ("script", "style", "noscript", "nav")
+}
+URL_RE = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\,)]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+# Removing special characters and then collapsing 2+ whitespace is done in one pass: any run of
+# 2+ non-alphanumerics becomes one space, a lone special character becomes a space and a lone
+# whitespace character is left as it is. Starting the pattern with a plain character class lets
+# the regex engine skip ahead to candidate positions quickly.
+RUN_RE = re.compile(r'[^a-zA-Z0-9](?:[^a-zA-Z0-9]+|(?<=\S))')
+# Characters that can never be part of a URL match above, so a URL never spans one of them
+URL_CHAR_RE = re.compile(r'[!$-_a-z]')
+
+CHUNK_SIZE = 1 << 20 # 1 MB
+# Longest unterminated '<...' or URL-like run held back waiting for more input
+MAX_PENDING = 64 * 1024
+
+
+class TextCleaner:
+    """
+    Incremental version of clean_text: feed() it chunks of a page and it returns the cleaned
+    text that is final so far, holding back only a small tail that could still change
+    (a half-read tag, URL or whitespace run). Memory stays bounded by the chunk size.
+    """
+
+    def __init__(self):
+        self._markup = ""     # raw input not yet past the tag/block stage
+        self._block = None    # name of the script/style/nav block being skipped, if any
+        self._urls = ""       # tag-free text that might still end in a partial URL
+        self._runs = ""       # trailing run of non-alphanumerics not yet collapsed
+        self._started = False # whether any non-whitespace output has been emitted
+
+    def _strip_markup(self, final):
+        buf, out, pos = self._markup, [], 0
+        while pos < len(buf):
+            if self._block:
+                close = BLOCK_CLOSE_RES[self._block].search(buf, pos)
+                if close is None:
+                    # Discard the block body, keeping just enough to catch a split closing tag
+                    pos = max(pos, len(buf) - 32)
+                    break
+                pos, self._block = close.end(), None
+                continue
+            start = buf.find('<', pos)
+            if start < 0:
+                out.append(buf[pos:])
+                pos = len(buf)
+                break
+            out.append(buf[pos:start])
+            end = buf.find('>', start)
+            if end < 0:
+                if final or len(buf) - start > MAX_PENDING:
+                    # Never closed: the '<' is plain text
+                    out.append('<')
+                    pos = start + 1
+                    continue
+                pos = start
+                break
+            opener = BLOCK_OPEN_RE.match(buf, start)
+            if opener:
+                self._block = opener.group(1).lower()
+                pos = opener.end()
+            else:
+                pos = end + 1
+        self._markup = buf[pos:] if not (final and self._block) else ""
+        return "".join(out)
+
+    def _strip_urls(self, text, final):
+        text = self._urls + text
+        cut = len(text)
+        if not final:
+            # Hold back the tail after the last character a URL can't contain
+            floor = max(0, len(text) - MAX_PENDING)
+            while cut > floor and URL_CHAR_RE.match(text, cut - 1):
+                cut -= 1
+            if cut == floor and floor > 0:
+                cut = len(text)
+        self._urls = text[cut:]
+        return URL_RE.sub('', text[:cut])
+
+    def _collapse(self, text, final):
+        text = self._runs + text
+        cut = len(text)
+        if not final:
+            # Hold back the trailing non-alphanumeric run, it may continue in the next chunk
+            while cut > 0 and not (text[cut - 1].isascii() and text[cut - 1].isalnum()):
+                cut -= 1
+        tail = text[cut:]
+        # A run of 2+ always collapses to one space, so a long run never needs to be kept whole
+        self._runs = tail if len(tail) < 2 else "  "
+        out = RUN_RE.sub(' ', text[:cut])
+        if not self._started:
+            out = out.lstrip()
+            self._started = bool(out)
+        return out.rstrip() if final else out
+
+    def feed(self, chunk):
+        """Adds a chunk of raw text and returns the newly finalised cleaned text."""
+        self._markup += chunk
+        text = self._strip_markup(final=False)
+        return self._collapse(self._strip_urls(text, final=False), final=False)
+
+    def close(self):
+        """Flushes the held-back tail; the cleaner must not be fed afterwards."""
+        text = self._strip_markup(final=True)
+        return self._collapse(self._strip_urls(text, final=True), final=True)
+
+
+def clean_text_stream(chunks):
+    """Yields cleaned text for an iterable of raw text chunks (e.g. an open file)."""
+    cleaner = TextCleaner()
+    for chunk in chunks:
+        out = cleaner.feed(chunk)
+        if out:
+            yield out
+    out = cleaner.close()
+    if out:
+        yield out
+
+
+def clean_file(path, chunk_size=CHUNK_SIZE, encoding="utf-8"):
+    """Cleans a (possibly multi-MB) scraped page from disk, reading it chunk by chunk."""
+    with metrics.span("clean_text"), open(path, "r", encoding=encoding, errors="replace") as f:
+        return "".join(clean_text_stream(iter(lambda: f.read(chunk_size), "")))
+
+
 def clean_text(text):
-    # Remove HTML tags (in case the source text was scraped)
-    text = re.sub(r'<[^>]*?>', '', text)
-    # Remove URLs
-    text = re.sub(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\,)]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', '', text)
-    # Remove special characters, keeping only letters, numbers, and spaces
-    text = re.sub(r'[^a-zA-Z0-9\s]', ' ', text)
-    # Replace multiple spaces with a single space
-    text = re.sub(r'\s{2,}', ' ', text)
-    # Trim leading and trailing whitespace
-    text = text.strip()
-    return text
\ No newline at end of file
+    # Removes HTML tags (and script/style/nav bodies), URLs and special characters, collapses
+    # whitespace runs and trims the ends
+    with metrics.span("clean_text"):
+        return "".join(clean_text_stream(text[i:i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)))
@@ -0,0 +1,117 @@
+##Process-wide background worker pool with single-flight coalescing of identical jobs
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# Threads shared by every Streamlit session in this process
+DEFAULT_WORKERS = int(os.getenv("MAILGENIE_WORKERS", "8"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Returns the process-wide worker pool, starting it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DEFAULT_WORKERS, thread_name_prefix="mailgenie-worker")
+        return _executor
+
+
+class Job:
+    """
+    A background job and its live progress. Every session waiting on the same request shares
+    one Job, so progress (including a partially streamed draft) is visible to all of them.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.future = None
+        self.submitted = time.monotonic()
+        self.message = "Queued..."
+        self.partial = ""
+        # Finished pieces of a multi-part job (e.g. one fanned-out draft each), shown as they land
+        self.ready = []
+        self.done = 0
+        self.total = 0
+        self.waiters = 1
+        self._lock = threading.Lock()
+
+    def update(self, **fields):
+        """Called from the worker to publish progress."""
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+    def append(self, text):
+        """Adds a streamed chunk to the partial output."""
+        with self._lock:
+            self.partial += text
+
+    def progress(self):
+        """Snapshot of the current progress for the UI thread."""
+        with self._lock:
+            return {
+                "message": self.message,
+                "partial": self.partial,
+                "ready": list(self.ready),
+                "done": self.done,
+                "total": self.total,
+                "waiters": self.waiters,
+                "elapsed": time.monotonic() - self.submitted,
+            }
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight jobs: while a job for `key` is running, submitting the same
+    key again returns the running Job instead of starting a second one.
+    """
+
+    def __init__(self, executor=None):
+        self._executor = executor
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args, **kwargs):
+        """
+        Runs fn(job, *args, **kwargs) on the worker pool unless a job for `key` is already in
+        flight. Returns (job, shared) where `shared` is True if an existing job was joined.
+        """
+        with self._lock:
+            job = self._inflight.get(key)
+            if job is not None:
+                job.waiters += 1
+                metrics.increment("mailgenie_coalesced_requests_total")
+                return job, True
+            job = self._inflight[key] = Job(key)
+            job.future = (self._executor or get_executor()).submit(fn, job, *args, **kwargs)
+        # Registered outside the lock: the callback runs immediately if the job already finished
+        job.future.add_done_callback(lambda _: self._forget(job))
+        return job, False
+
+    def _forget(self, job):
+        with self._lock:
+            if self._inflight.get(job.key) is job:
+                del self._inflight[job.key]
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._inflight)
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    """Returns the process-wide SingleFlight, shared by every session."""
+    global _single_flight
+    with _single_flight_lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight()
+        return _single_flight